@@ -1,29 +1,144 @@
-import openai
+import argparse
+import asyncio
+import json
 import os
+import sys
+from collections import deque
+
+import httpx
 from dotenv import load_dotenv
+from openai import OpenAI, AsyncOpenAI, DefaultAsyncHttpxClient
 
 load_dotenv()
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+MODEL = "gpt-4o-mini"
+MAX_TOKENS = 100
+DEFAULT_CONCURRENCY = 16
+DEFAULT_RETRIES = 3
+DEFAULT_TIMEOUT = 60.0
+
+client = None
 
 
 def ask_question(question):
+    global client
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
+        if client is None:
+            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        response = client.chat.completions.create(
+            model=MODEL,
             messages=[{"role": "user", "content": question}],
-            max_tokens=100,
+            max_tokens=MAX_TOKENS,
         )
-        answer = response["choices"][0]["message"]["content"].strip()
+        answer = response.choices[0].message.content.strip()
         return answer
     except Exception as e:
         return f"An error occurred: {str(e)}"
 
 
+async def ask_question_async(async_client, question, semaphore):
+    async with semaphore:
+        response = await async_client.chat.completions.create(
+            model=MODEL,
+            messages=[{"role": "user", "content": question}],
+            max_tokens=MAX_TOKENS,
+        )
+    return response.choices[0].message.content.strip()
+
+
+def parse_question(line, line_number):
+    # Lines are either {"id": ..., "question": ...} objects or plain JSON strings.
+    item = json.loads(line)
+    if isinstance(item, str):
+        item = {"question": item}
+    item.setdefault("id", line_number)
+    return item
+
+
+async def answer_line(async_client, line, line_number, semaphore):
+    result = {"id": line_number}
+    try:
+        item = parse_question(line, line_number)
+        result = {"id": item["id"], "question": item.get("question")}
+        if not item.get("question"):
+            raise ValueError("No question provided.")
+        result["answer"] = await ask_question_async(async_client, item["question"], semaphore)
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+async def answer_batch(input_file, output_file, concurrency=DEFAULT_CONCURRENCY, retries=DEFAULT_RETRIES, timeout=DEFAULT_TIMEOUT):
+    # One pooled client for the whole batch; the SDK retries 429s, 5xx and
+    # connection errors with exponential backoff up to `retries` times.
+    async_client = AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        max_retries=retries,
+        timeout=timeout,
+        http_client=DefaultAsyncHttpxClient(
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        ),
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+    # Answers are written in input order. Reading runs at most `window` questions
+    # ahead of the oldest unanswered one, so memory stays bounded for any input size.
+    window = concurrency * 4
+    pending = deque()
+    answered = failed = 0
+
+    def write(result):
+        nonlocal answered, failed
+        output_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+        output_file.flush()
+        if "error" in result:
+            failed += 1
+        else:
+            answered += 1
+
+    async with async_client:
+        line_number = 0
+        while True:
+            line = await asyncio.to_thread(input_file.readline)
+            if not line:
+                break
+            line_number += 1
+            if not line.strip():
+                continue
+            pending.append(asyncio.create_task(answer_line(async_client, line, line_number, semaphore)))
+
+            while len(pending) >= window or (pending and pending[0].done()):
+                write(await pending.popleft())
+
+        while pending:
+            write(await pending.popleft())
+
+    return answered, failed
+
+
 if __name__ == "__main__":
-    question = input("Please enter your question: ")
-    if question:
-        answer = ask_question(question)
-        print("Answer:", answer)
+    parser = argparse.ArgumentParser(description="Answer questions with OpenAI's GPT model.")
+    parser.add_argument("--batch", metavar="FILE", help="Answer every question in a JSONL file ('-' reads stdin) instead of asking for one.")
+    parser.add_argument("--output", metavar="FILE", help="Write the JSONL answers to this file instead of stdout.")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Maximum number of questions sent to the API at the same time.")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="Retries per question on rate limits, server and connection errors.")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="Seconds to wait for each API request.")
+    args = parser.parse_args()
+
+    if args.batch:
+        input_file = sys.stdin if args.batch == "-" else open(args.batch, "r", encoding="utf-8")
+        output_file = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            answered, failed = asyncio.run(answer_batch(input_file, output_file, args.concurrency, args.retries, args.timeout))
+        finally:
+            if input_file is not sys.stdin:
+                input_file.close()
+            if output_file is not sys.stdout:
+                output_file.close()
+        print(f"Answered {answered} questions, {failed} failed.", file=sys.stderr)
     else:
-        print("Please provide a valid question.")
+        question = input("Please enter your question: ")
+        if question:
+            answer = ask_question(question)
+            print("Answer:", answer)
+        else:
+            print("Please provide a valid question.")
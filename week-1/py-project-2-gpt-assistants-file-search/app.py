@@ -1,26 +1,58 @@
+import argparse
+import hashlib
 import os
 import openai
+import tempfile
+import threading
 import time
-from flask import Flask, request, jsonify, render_template
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, jsonify, render_template, session, url_for
 from werkzeug.utils import secure_filename
-from openai import OpenAI
+from openai import OpenAI, NotFoundError
+from registry import Registry, DEFAULT_REGISTRY_PATH, config_hash, upload_hash
+from thread_manager import ThreadManager, DEFAULT_MAX_SESSIONS, DEFAULT_IDLE_SECONDS
+from upload_jobs import UploadJobs
 
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['ALLOWED_EXTENSIONS'] = {'pdf'}
 
 from dotenv import load_dotenv
 load_dotenv()
+# Sessions only carry a random client id; without a fixed key they last until restart.
+app.secret_key = os.getenv('FLASK_SECRET_KEY') or os.urandom(32)
 openai = OpenAI()
 openai.api_key = os.getenv('OPENAI_API_KEY')
 
 assistant_id = None
-vector_store_id = None
-thread_id = None
-polling_interval = None
+# First wait between run status checks, in seconds. It doubles after every
+# check up to MAX_POLLING_INTERVAL, so short runs are noticed quickly.
+polling_interval = float(os.getenv('POLLING_INTERVAL', 0.25))
+MAX_POLLING_INTERVAL = 2.0
+RUN_TIMEOUT = float(os.getenv('RUN_TIMEOUT', 60))
+ANSWER_MESSAGE_LIMIT = 1
+TERMINAL_RUN_STATUSES = {"completed", "failed", "cancelled", "expired", "incomplete", "requires_action"}
+
+ASSISTANT_CONFIG = {
+    "name": "File-based Assistant",
+    "instructions": "You are an assistant that answers questions based on the uploaded PDF file.",
+    "model": "gpt-4o-mini",
+    "tools": [{"type": "file_search"}]
+}
+VECTOR_STORE_NAME = "Document Vector Store"
+
+registry = Registry(os.getenv('REGISTRY_PATH', DEFAULT_REGISTRY_PATH))
+# Recreating a deleted assistant happens once, however many runs notice it.
+assistant_lock = threading.Lock()
+
+# Uploads up to this size stay in memory; larger ones spill to a temporary file.
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+upload_jobs = UploadJobs()
+upload_executor = ThreadPoolExecutor(max_workers=int(os.getenv('UPLOAD_WORKERS', 4)))
 
 @app.route('/')
 def index():
+    client_id()
     return render_template('index.html')
 
 
@@ -29,55 +61,153 @@ def allowed_file(filename):
 
 def create_assistant():
     global assistant_id
-    assistant = openai.beta.assistants.create(
-        name="File-based Assistant",
-        instructions="You are an assistant that answers questions based on the uploaded PDF file.",
-        model="gpt-4o-mini",
-        tools=[{"type": "file_search"}]
-    )
+    key = config_hash(ASSISTANT_CONFIG)
+    known = registry.get_assistant(key)
+    if known:
+        assistant_id = known["assistant_id"]
+        print(f"Reusing assistant with ID: {assistant_id}")
+        if known["vector_store_id"]:
+            # Older versions attached uploads to the assistant, which every session searches.
+            openai.beta.assistants.update(assistant_id, tool_resources={"file_search": {"vector_store_ids": []}})
+            registry.put_assistant(key, assistant_id)
+        return
+
+    assistant = openai.beta.assistants.create(**ASSISTANT_CONFIG)
     assistant_id = assistant.id
+    registry.put_assistant(key, assistant_id)
     print(f"Assistant created with ID: {assistant_id}")
 
-def upload_pdf_to_vector_store(file_path):
-    global vector_store_id
-    try:
+def recreate_assistant(missing_id):
+    with assistant_lock:
+        if assistant_id != missing_id:
+            return
+        try:
+            openai.beta.assistants.retrieve(missing_id)
+            return
+        except NotFoundError:
+            pass
+        # The assistant was deleted outside this app; create a new one.
+        registry.delete_assistant(config_hash(ASSISTANT_CONFIG))
+        create_assistant()
+
+def attach_vector_store(owner, store_id):
+    # The assistant is shared, so documents are attached to the session's own
+    # thread; other sessions never search them.
+    tool_resources = {"file_search": {"vector_store_ids": [store_id]}}
+    with thread_manager.session(owner) as thread_id:
+        openai.beta.threads.update(thread_id, tool_resources=tool_resources)
+    print(f"Thread {thread_id} uses Vector Store ID: {store_id}")
+
+def spool_upload(file):
+    # Flask closes the request's files when the request ends, so the upload is
+    # copied into a buffer the background job owns, and hashed on the way.
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    digest = hashlib.sha256()
+    for block in iter(lambda: file.stream.read(1024 * 1024), b""):
+        digest.update(block)
+        buffer.write(block)
+    buffer.seek(0)
+    return {"filename": secure_filename(file.filename), "buffer": buffer, "content_hash": digest.hexdigest()}
+
+def upload_pdf_to_vector_store(owner, uploads, job_id):
+    key = upload_hash([upload["content_hash"] for upload in uploads])
+    known = registry.get_upload(key)
+    if known:
+        try:
+            openai.beta.vector_stores.retrieve(known["vector_store_id"])
+        except NotFoundError:
+            print(f"Vector store {known['vector_store_id']} no longer exists, uploading again")
+            registry.delete_upload(key)
+        else:
+            attach_vector_store(owner, known["vector_store_id"])
+            print(f"Files were uploaded before, reusing Vector Store ID: {known['vector_store_id']}")
+            return known["vector_store_id"]
+
+    upload_jobs.update(job_id, status="uploading")
+    file_ids = []
+    for upload in uploads:
         file_data = openai.files.create(
-            file=open(file_path, 'rb'),
+            file=(upload["filename"], upload["buffer"]),
             purpose='assistants'
         )
-
+        file_ids.append(file_data.id)
         print(f"File uploaded with ID: {file_data.id}")
 
-        vector_store = openai.beta.vector_stores.create(
-            name="Document Vector Store" 
-        )
-
-        vector_store_response = openai.beta.vector_stores.files.create(
-            vector_store_id=vector_store.id,
-            file_id=file_data.id
-        )
-        print("File added to vector store", vector_store_response)
-
-        vector_store_id = vector_store.id
-        print(f"Vector store created with ID: {vector_store_id}")
+    upload_jobs.update(job_id, status="indexing")
+    vector_store = openai.beta.vector_stores.create(
+        name=VECTOR_STORE_NAME
+    )
+    print(f"Vector store created with ID: {vector_store.id}")
 
-        openai.beta.assistants.update(assistant_id, tool_resources={
-            "file_search": {"vector_store_ids": [vector_store_id]}
-        })
+    batch = openai.beta.vector_stores.file_batches.create_and_poll(
+        vector_store_id=vector_store.id,
+        file_ids=file_ids
+    )
+    print("Files added to vector store", batch.file_counts)
+    if batch.status != "completed" or batch.file_counts.failed:
+        raise RuntimeError(f"{batch.file_counts.failed} of {batch.file_counts.total} files could not be indexed")
 
-        print(f"Assistant updated with Vector Store ID: {vector_store_id}")
-        return vector_store_id
+    registry.put_upload(key, ", ".join(upload["filename"] for upload in uploads), file_ids, vector_store.id)
+    attach_vector_store(owner, vector_store.id)
+    return vector_store.id
 
+def run_upload_job(owner, job_id, uploads):
+    try:
+        vector_store_id = upload_pdf_to_vector_store(owner, uploads, job_id)
+        upload_jobs.update(job_id, status="completed", vector_store_id=vector_store_id)
     except Exception as e:
         print(f"Error uploading file or creating vector store: {e}")
-        return None
+        upload_jobs.update(job_id, status="failed", error=str(e))
+    finally:
+        for upload in uploads:
+            upload["buffer"].close()
+
+def collect_garbage(dry_run=False):
+    uploads = registry.uploads()
+    known_stores = {upload["vector_store_id"] for upload in uploads}
+    known_files = {file_id for upload in uploads for file_id in upload["file_ids"]}
+    remote_stores = set()
+
+    # Only stores this app names are considered; anything else in the project is left alone.
+    for store in openai.beta.vector_stores.list(limit=100):
+        remote_stores.add(store.id)
+        if store.name != VECTOR_STORE_NAME or store.id in known_stores:
+            continue
+        print(f"Deleting orphaned vector store {store.id}")
+        if dry_run:
+            continue
+        for store_file in openai.beta.vector_stores.files.list(vector_store_id=store.id, limit=100):
+            if store_file.id not in known_files:
+                print(f"Deleting orphaned file {store_file.id}")
+                openai.files.delete(store_file.id)
+        openai.beta.vector_stores.delete(store.id)
+
+    for upload in uploads:
+        if upload["vector_store_id"] not in remote_stores:
+            print(f"Forgetting {upload['filename']}: vector store {upload['vector_store_id']} no longer exists")
+            if not dry_run:
+                registry.delete_upload(upload["content_hash"])
 
 def create_thread():
-    global thread_id
     thread = openai.beta.threads.create()
-    thread_id = thread.id
-    print(f"Thread created with ID: {thread_id}")
-    return thread
+    print(f"Thread created with ID: {thread.id}")
+    return thread.id
+
+def delete_thread(thread_id):
+    openai.beta.threads.delete(thread_id)
+    print(f"Thread deleted with ID: {thread_id}")
+
+thread_manager = ThreadManager(
+    create_thread,
+    delete_thread,
+    max_sessions=int(os.getenv('MAX_SESSIONS', DEFAULT_MAX_SESSIONS)),
+    idle_seconds=float(os.getenv('SESSION_IDLE_SECONDS', DEFAULT_IDLE_SECONDS))
+)
+
+def client_id():
+    if 'client_id' not in session:
+        session['client_id'] = uuid.uuid4().hex
+    return session['client_id']
 
 def add_question(thread_id, question):
     response = openai.beta.threads.messages.create(
@@ -88,23 +218,70 @@ def add_question(thread_id, question):
     return response
 
 def run_assistant(thread_id):
-    response = openai.beta.threads.runs.create(
-        thread_id=thread_id,
-        assistant_id=assistant_id
-    )
+    current_id = assistant_id
+    try:
+        response = openai.beta.threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=current_id
+        )
+    except NotFoundError:
+        recreate_assistant(current_id)
+        if assistant_id == current_id:
+            raise
+        response = openai.beta.threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=assistant_id
+        )
     print(f"Assistant run response: {response}")
     return response
 
-def checking_status(thread_id, run_id):
+def elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 1)
+
+def wait_for_run(thread_id, run_id, timeout=RUN_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    delay = polling_interval
+    while True:
+        run_object = openai.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+        if run_object.status in TERMINAL_RUN_STATUSES:
+            return run_object
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            print(f"Run {run_id} did not finish within {timeout}s, cancelling it")
+            try:
+                openai.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+            except Exception as e:
+                # The run may have finished in the meantime.
+                print(f"Error cancelling run: {e}")
+            return None
+
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, MAX_POLLING_INTERVAL)
+
+def checking_status(thread_id, run_id, timings=None):
+    timings = {} if timings is None else timings
     try:
         print("thread id ** ", thread_id)
         print("run id ** ", run_id)
-        run_object = openai.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+        start = time.perf_counter()
+        run_object = wait_for_run(thread_id, run_id)
+        timings["run_ms"] = elapsed_ms(start)
+        if run_object is None:
+            return None, "timeout"
+
         status = run_object.status
         print(f"Current status: {status}")
 
         if status == "completed":
-            thread_messages = openai.beta.threads.messages.list(thread_id)
+            start = time.perf_counter()
+            # Only the newest message of this run is needed, however long the thread is.
+            thread_messages = openai.beta.threads.messages.list(
+                thread_id,
+                run_id=run_id,
+                order="desc",
+                limit=ANSWER_MESSAGE_LIMIT
+            )
             answers = []
 
             for message in thread_messages.data:
@@ -113,65 +290,94 @@ def checking_status(thread_id, run_id):
                         if content_item.type == 'text':
                             answers.append(content_item.text.value.strip())
 
+            timings["messages_ms"] = elapsed_ms(start)
             print("answers => ", answers)
-            return answers[0] if answers else None
+            return (answers[0] if answers else None), status
+
+        return None, status
 
     except Exception as e:
         print(f"Error checking status or retrieving messages: {e}")
-        return None
+        return None, "error"
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
     if 'file' not in request.files:
         return jsonify({'error': 'No file uploaded.'}), 400
 
-    file = request.files['file']
-    if file.filename == '':
+    files = [file for file in request.files.getlist('file') if file.filename != '']
+    if not files:
         return jsonify({'error': 'No file selected.'}), 400
 
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-
-        vector_store_id = upload_pdf_to_vector_store(file_path)
-        os.remove(file_path)
-
-        if vector_store_id:
-            return jsonify({'message': 'File uploaded and processed successfully.'}), 200
-        else:
-            return jsonify({'error': 'Failed to process file.'}), 500
-
-    return jsonify({'error': 'Invalid file type.'}), 400
+    if not all(allowed_file(file.filename) for file in files):
+        return jsonify({'error': 'Invalid file type.'}), 400
+
+    uploads = [spool_upload(file) for file in files]
+    job_id = upload_jobs.create([upload["filename"] for upload in uploads])
+    upload_executor.submit(run_upload_job, client_id(), job_id, uploads)
+    return jsonify({
+        'message': 'File accepted.',
+        'job_id': job_id,
+        'status_url': url_for('upload_status', job_id=job_id)
+    }), 202
+
+@app.route('/upload/status/<job_id>', methods=['GET'])
+def upload_status(job_id):
+    job = upload_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown upload job.'}), 404
+    return jsonify(job), 200
 
 @app.route('/ask', methods=['POST'])
 def ask_question():
-    global thread_id, polling_interval
-
     data = request.get_json()
     question = data.get('question')
 
     if not question:
         return jsonify({'error': 'No question provided.'}), 400
 
-    if not thread_id:
-        create_thread()
+    timings = {}
+    started = time.perf_counter()
+    with thread_manager.session(client_id()) as thread_id:
+        timings["thread_ms"] = elapsed_ms(started)
 
-    add_question(thread_id, question)
-    run_response = run_assistant(thread_id)
-    run_id = run_response.id
+        start = time.perf_counter()
+        add_question(thread_id, question)
+        timings["add_question_ms"] = elapsed_ms(start)
 
-    time.sleep(6)  
+        start = time.perf_counter()
+        run_response = run_assistant(thread_id)
+        run_id = run_response.id
+        timings["create_run_ms"] = elapsed_ms(start)
+
+        answers, status = checking_status(thread_id, run_id, timings)
+    timings["total_ms"] = elapsed_ms(started)
+    print("timings => ", timings)
 
-    answers = checking_status(thread_id, run_id)
     if answers:
-        return jsonify({'answers': answers}), 200
+        return jsonify({'answers': answers, 'timings': timings}), 200
+    elif status == "timeout":
+        return jsonify({'error': 'The assistant did not answer in time.', 'timings': timings}), 504
     else:
-        return jsonify({'error': 'No answers found.'}), 500
+        return jsonify({'error': 'No answers found.', 'timings': timings}), 500
 
 if __name__ == '__main__':
-    if not os.path.exists(app.config['UPLOAD_FOLDER']):
-        os.makedirs(app.config['UPLOAD_FOLDER'])
+    parser = argparse.ArgumentParser(description="Answer questions about uploaded PDF files.")
+    parser.add_argument('command', nargs='?', choices=['serve', 'gc'], default='serve', help="Run the web app (default) or delete orphaned vector stores.")
+    parser.add_argument('--dry-run', action='store_true', help="gc only: print what would be deleted without deleting it.")
+    parser.add_argument('--port', type=int, default=3000, help="Port to serve on.")
+    parser.add_argument('--threads', type=int, default=16, help="Number of requests served at the same time.")
+    parser.add_argument('--debug', action='store_true', help="Use the Flask development server with auto-reload.")
+    args = parser.parse_args()
+
+    if args.command == 'gc':
+        collect_garbage(args.dry_run)
+        raise SystemExit
 
     create_assistant()
-    app.run(debug=True, port=3000) 
\ No newline at end of file
+    if args.debug:
+        app.run(debug=True, port=args.port, threaded=True)
+    else:
+        from waitress import serve
+        print(f"Serving on http://localhost:{args.port} with {args.threads} threads")
+        serve(app, port=args.port, threads=args.threads) 
\ No newline at end of file
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+DEFAULT_REGISTRY_PATH = "registry.sqlite3"
+
+
+def config_hash(config):
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def upload_hash(content_hashes):
+    # A single PDF is keyed by its own hash; a set of PDFs by the hash of their
+    # sorted hashes, so the same files uploaded in any order match.
+    if len(content_hashes) == 1:
+        return content_hashes[0]
+    return hashlib.sha256(",".join(sorted(content_hashes)).encode("utf-8")).hexdigest()
+
+
+# Remembers the OpenAI objects this app created, so restarts and repeat uploads
+# reuse them instead of creating new ones. Assistants are keyed by a hash of
+# their config and uploads by a hash of the PDF contents. An upload of several
+# PDFs is one entry whose file_id column lists the comma-separated file ids.
+class Registry:
+    def __init__(self, path=DEFAULT_REGISTRY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS assistants ("
+            "config_hash TEXT PRIMARY KEY, assistant_id TEXT NOT NULL, vector_store_id TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS uploads ("
+            "content_hash TEXT PRIMARY KEY, filename TEXT NOT NULL, file_id TEXT NOT NULL, "
+            "vector_store_id TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_assistant(self, config_hash):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT assistant_id, vector_store_id FROM assistants WHERE config_hash = ?", (config_hash,)
+            ).fetchone()
+        return {"assistant_id": row[0], "vector_store_id": row[1]} if row else None
+
+    def put_assistant(self, config_hash, assistant_id, vector_store_id=None):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO assistants VALUES (?, ?, ?)", (config_hash, assistant_id, vector_store_id))
+            self._conn.commit()
+
+    def delete_assistant(self, config_hash):
+        with self._lock:
+            self._conn.execute("DELETE FROM assistants WHERE config_hash = ?", (config_hash,))
+            self._conn.commit()
+
+    def get_upload(self, content_hash):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT filename, file_id, vector_store_id FROM uploads WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+            if row:
+                self._conn.execute("UPDATE uploads SET last_used = ? WHERE content_hash = ?", (time.time(), content_hash))
+                self._conn.commit()
+        return {"filename": row[0], "file_ids": row[1].split(","), "vector_store_id": row[2]} if row else None
+
+    def put_upload(self, content_hash, filename, file_ids, vector_store_id):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO uploads VALUES (?, ?, ?, ?, ?, ?)",
+                (content_hash, filename, ",".join(file_ids), vector_store_id, now, now)
+            )
+            self._conn.commit()
+
+    def delete_upload(self, content_hash):
+        with self._lock:
+            self._conn.execute("DELETE FROM uploads WHERE content_hash = ?", (content_hash,))
+            self._conn.commit()
+
+    def uploads(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT content_hash, filename, file_id, vector_store_id FROM uploads").fetchall()
+        return [
+            {"content_hash": row[0], "filename": row[1], "file_ids": row[2].split(","), "vector_store_id": row[3]}
+            for row in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
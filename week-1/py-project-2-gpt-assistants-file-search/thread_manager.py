@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+DEFAULT_MAX_SESSIONS = 1000
+DEFAULT_IDLE_SECONDS = 30 * 60
+
+
+class SessionThread:
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+
+# Gives every client its own assistant thread. Sessions are kept in LRU order
+# and dropped when idle for too long or when there are more than max_sessions.
+# Each thread has its own lock, so only questions on the same thread wait for
+# each other; the manager's lock is never held during API calls.
+class ThreadManager:
+    def __init__(self, create_thread, delete_thread=None, max_sessions=DEFAULT_MAX_SESSIONS, idle_seconds=DEFAULT_IDLE_SECONDS):
+        self.create_thread = create_thread
+        self.delete_thread = delete_thread
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def session(self, client_id):
+        entry = self._get(client_id)
+        if entry is None:
+            entry = SessionThread(self.create_thread())
+            with self._lock:
+                # Another request of the same client may have created one first.
+                existing = self._sessions.get(client_id)
+                if existing is not None:
+                    discarded, entry = entry, existing
+                else:
+                    discarded = None
+                    self._sessions[client_id] = entry
+            if discarded is not None:
+                self._delete([discarded])
+
+        with entry.lock:
+            entry.last_used = time.monotonic()
+            try:
+                yield entry.thread_id
+            finally:
+                entry.last_used = time.monotonic()
+        self._delete(self._expire())
+
+    def _get(self, client_id):
+        with self._lock:
+            entry = self._sessions.get(client_id)
+            if entry is not None:
+                entry.last_used = time.monotonic()
+                self._sessions.move_to_end(client_id)
+            return entry
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            for client_id, entry in list(self._sessions.items()):
+                over_capacity = len(self._sessions) > self.max_sessions
+                if not over_capacity and now - entry.last_used < self.idle_seconds:
+                    break
+                # Threads with a question in progress stay until it is answered.
+                if entry.lock.locked():
+                    continue
+                del self._sessions[client_id]
+                expired.append(entry)
+        return expired
+
+    def _delete(self, entries):
+        if self.delete_thread is None:
+            return
+        for entry in entries:
+            try:
+                self.delete_thread(entry.thread_id)
+            except Exception as e:
+                print(f"Error deleting thread {entry.thread_id}: {e}")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
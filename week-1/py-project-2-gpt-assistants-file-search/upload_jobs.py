@@ -0,0 +1,44 @@
+import threading
+import time
+import uuid
+
+# Finished jobs are kept this long so clients can still read their result.
+DEFAULT_JOB_RETENTION_SECONDS = 60 * 60
+
+
+# Status of background uploads, polled through /upload/status/<job_id>.
+class UploadJobs:
+    def __init__(self, retention_seconds=DEFAULT_JOB_RETENTION_SECONDS):
+        self.retention_seconds = retention_seconds
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, filenames):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "filenames": list(filenames),
+                "vector_store_id": None,
+                "error": None,
+                "created_at": now,
+                "updated_at": now
+            }
+        return job_id
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields, updated_at=time.time())
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _prune(self, now):
+        for job_id, job in list(self._jobs.items()):
+            if job["status"] in ("completed", "failed") and now - job["updated_at"] > self.retention_seconds:
+                del self._jobs[job_id]
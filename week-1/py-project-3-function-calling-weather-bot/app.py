@@ -1,124 +1,260 @@
-import openai
+import argparse
+import hashlib
+import json
 import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 from dotenv import load_dotenv
+from tool_registry import ToolRegistry
+from weather import WeatherService, StubWeatherProvider, DEFAULT_TTL_SECONDS
+from run_trace import RunTrace
+from conversations import ConversationManager, ConversationBusy, DEFAULT_IDLE_SECONDS, DEFAULT_MAX_PENDING
 load_dotenv()
 openai = OpenAI()
 openai.api_key = os.getenv('OPENAI_API_KEY')
 
+ASSISTANT_CACHE_PATH = os.getenv('ASSISTANT_CACHE_PATH', 'assistant.json')
+TERMINAL_RUN_EVENTS = {
+  "thread.run.completed", "thread.run.failed", "thread.run.cancelled", "thread.run.expired", "thread.run.incomplete"
+}
+# Guards against a run that keeps asking for tools forever.
+MAX_TOOL_ROUNDS = 10
+
 assistant_id = None
-thread_id = None
-
-assistant = openai.beta.assistants.create(
-  instructions="You are a weather bot. Use the provided functions to answer questions.",
-  model="gpt-4o",
-  tools=[
-    {
-      "type": "function",
-      "function": {
-        "name": "get_current_temperature",
-        "description": "Get the current temperature for a specific location",
-        "parameters": {
-          "type": "object",
-          "properties": {
-            "location": {
-              "type": "string",
-              "description": "The city and state, e.g., San Francisco, CA"
-            },
-            "unit": {
-              "type": "string",
-              "enum": ["Celsius", "Fahrenheit"],
-              "description": "The temperature unit to use. Infer this from the user's location."
-            }
-          },
-          "required": ["location", "unit"]
-        }
+
+tools = ToolRegistry(timeout=float(os.getenv('TOOL_TIMEOUT', 10)))
+weather = WeatherService(
+  StubWeatherProvider(latency=float(os.getenv('STUB_WEATHER_LATENCY', 0))),
+  ttl=float(os.getenv('WEATHER_CACHE_TTL', DEFAULT_TTL_SECONDS))
+)
+
+
+@tools.register(
+  description="Get the current temperature for a specific location",
+  parameters={
+    "type": "object",
+    "properties": {
+      "location": {
+        "type": "string",
+        "description": "The city and state, e.g., San Francisco, CA"
+      },
+      "unit": {
+        "type": "string",
+        "enum": ["Celsius", "Fahrenheit"],
+        "description": "The temperature unit to use. Infer this from the user's location."
       }
     },
-    {
-      "type": "function",
-      "function": {
-        "name": "get_rain_probability",
-        "description": "Get the probability of rain for a specific location",
-        "parameters": {
-          "type": "object",
-          "properties": {
-            "location": {
-              "type": "string",
-              "description": "The city and state, e.g., San Francisco, CA"
-            }
-          },
-          "required": ["location"]
-        }
-      }
-    }
-  ]
+    "required": ["location", "unit"]
+  }
 )
+def get_current_temperature(location, unit):
+  return str(weather.temperature(location, unit))
 
-thread = openai.beta.threads.create()
-message = openai.beta.threads.messages.create(
-  thread_id=thread.id,
-  role="user",
-  content="What's the weather in San Francisco today and the likelihood it'll rain?",
-)
 
-run = openai.beta.threads.runs.create_and_poll(
-  thread_id=thread.id,
-  assistant_id=assistant.id,
+@tools.register(
+  description="Get the probability of rain for a specific location",
+  parameters={
+    "type": "object",
+    "properties": {
+      "location": {
+        "type": "string",
+        "description": "The city and state, e.g., San Francisco, CA"
+      }
+    },
+    "required": ["location"]
+  }
 )
- 
-if run.status == 'completed':
-  messages = openai.beta.threads.messages.list(
-    thread_id=thread.id
+def get_rain_probability(location):
+  return str(weather.rain_probability(location))
+
+
+def assistant_config():
+  return {
+    "instructions": "You are a weather bot. Use the provided functions to answer questions.",
+    "model": "gpt-4o",
+    "tools": tools.schemas()
+  }
+
+
+def get_assistant():
+  # The assistant id is cached per config, so restarts don't create a new
+  # assistant and changing the instructions, model or tools does.
+  global assistant_id
+  if assistant_id:
+    return assistant_id
+
+  config = assistant_config()
+  key = hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+  cache = {}
+  if os.path.exists(ASSISTANT_CACHE_PATH):
+    with open(ASSISTANT_CACHE_PATH, "r", encoding="utf-8") as f:
+      cache = json.load(f)
+
+  if key in cache:
+    assistant_id = cache[key]
+    print(f"Reusing assistant with ID: {assistant_id}")
+    return assistant_id
+
+  assistant = openai.beta.assistants.create(**config)
+  assistant_id = assistant.id
+  cache[key] = assistant_id
+  with open(ASSISTANT_CACHE_PATH, "w", encoding="utf-8") as f:
+    json.dump(cache, f, indent=2)
+  print(f"Assistant created with ID: {assistant_id}")
+  return assistant_id
+
+
+def stream_run(thread_id, on_text=None, trace=None):
+  # Drives the run from its event stream: tool calls are dispatched as soon as
+  # requires_action arrives and answer text is passed to on_text as it is
+  # generated. Returns the final run, the answer text and the trace.
+  trace = trace or RunTrace()
+  answer = []
+  run = None
+  rounds = 0
+  manager = openai.beta.threads.runs.stream(
+    thread_id=thread_id,
+    assistant_id=get_assistant(),
+  )
+
+  while manager is not None:
+    next_manager = None
+    with manager as stream:
+      for event in stream:
+        trace.record(event)
+        if event.event == "thread.message.delta":
+          for block in event.data.delta.content or []:
+            if block.type == "text" and block.text and block.text.value:
+              trace.mark("first_token_ms")
+              answer.append(block.text.value)
+              if on_text:
+                on_text(block.text.value)
+        elif event.event == "thread.run.requires_action":
+          run = event.data
+          rounds += 1
+          if rounds > MAX_TOOL_ROUNDS:
+            openai.beta.threads.runs.cancel(thread_id=thread_id, run_id=run.id)
+            break
+          trace.mark("first_tool_dispatch_ms")
+          start = time.perf_counter()
+          tool_outputs = tools.execute(run.required_action.submit_tool_outputs.tool_calls)
+          trace.add("tools_ms", (time.perf_counter() - start) * 1000)
+          print(f"Tool outputs submitted ({len(tool_outputs)} calls, round {rounds}).")
+          next_manager = openai.beta.threads.runs.submit_tool_outputs_stream(
+            thread_id=thread_id,
+            run_id=run.id,
+            tool_outputs=tool_outputs
+          )
+        elif event.event in TERMINAL_RUN_EVENTS:
+          run = event.data
+        elif event.event == "error":
+          print("Stream error:", event.data)
+    manager = next_manager
+
+  return run, "".join(answer), trace
+
+
+def ask(question, thread_id=None, on_text=None, trace=None):
+  if thread_id is None:
+    thread_id = openai.beta.threads.create().id
+  openai.beta.threads.messages.create(
+    thread_id=thread_id,
+    role="user",
+    content=question,
   )
-  print(messages)
-else:
-  print(run.status)
- 
-tool_outputs = []
- 
-# Loop through each tool in the required action section
-for tool in run.required_action.submit_tool_outputs.tool_calls:
-  if tool.function.name == "get_current_temperature":
-    tool_outputs.append({
-      "tool_call_id": tool.id,
-      "output": "57"
-    })
-  elif tool.function.name == "get_rain_probability":
-    tool_outputs.append({
-      "tool_call_id": tool.id,
-      "output": "0.06"
-    })
- 
-# Submit all tool outputs at once after collecting them in a list
-if tool_outputs:
+
+  run, answer, trace = stream_run(thread_id, on_text, trace)
+  if run is None or run.status != "completed":
+    print(run.status if run else "No run result")
+    return None
+  return answer
+
+
+def create_thread():
+  return openai.beta.threads.create().id
+
+
+def delete_thread(thread_id):
+  openai.beta.threads.delete(thread_id)
+
+
+conversations = ConversationManager(
+  create_thread,
+  delete_thread,
+  max_pending=int(os.getenv('MAX_PENDING_PER_CONVERSATION', DEFAULT_MAX_PENDING)),
+  idle_seconds=float(os.getenv('CONVERSATION_IDLE_SECONDS', DEFAULT_IDLE_SECONDS))
+)
+
+
+def handle_request(line):
+  result = {}
   try:
-    run = openai.beta.threads.runs.submit_tool_outputs_and_poll(
-      thread_id=thread.id,
-      run_id=run.id,
-      tool_outputs=tool_outputs
-    )
-    print("Tool outputs submitted successfully.")
+    request = json.loads(line)
+    result = {"id": request.get("id"), "conversation_id": request["conversation_id"]}
+    if not request.get("message"):
+      raise ValueError("No message provided.")
+
+    trace = RunTrace()
+    with conversations.turn(str(request["conversation_id"])) as thread_id:
+      answer = ask(request["message"], thread_id=thread_id, trace=trace)
+    if answer:
+      result["answer"] = answer
+    else:
+      result["error"] = "No answer."
+    result["trace"] = trace.summary()
+  except ConversationBusy as e:
+    result["error"] = str(e)
   except Exception as e:
-    print("Failed to submit tool outputs:", e)
-else:
-  print("No tool outputs to submit.")
- 
-if run.status == 'completed':
-  messages = openai.beta.threads.messages.list(
-    thread_id=thread.id
-  )
-  print("messages ===>  ", messages)
-  for message in messages:
-    if message.assistant_id is not None:  
-        content_blocks = message.content
-        for content_block in content_blocks:
-            text_content = content_block.text.value
-            if text_content:
-                print("/\nAssistant Response:", text_content)
-  
-else:
-  print(run.status)
+    result["error"] = f"{e.__class__.__name__}: {e}"
+  return result
+
+
+def serve(input_file, output_file, workers):
+  # Requests are {"conversation_id": ..., "message": ..., "id": optional} lines.
+  # Responses are written as they finish, so they carry the request's ids.
+  get_assistant()
+  output_lock = threading.Lock()
+
+  def respond(line):
+    result = handle_request(line)
+    with output_lock:
+      output_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+      output_file.flush()
+
+  with ThreadPoolExecutor(max_workers=workers) as executor:
+    for line in input_file:
+      if line.strip():
+        executor.submit(respond, line)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Ask the weather bot a question.")
+  parser.add_argument('question', nargs='?', default="What's the weather in San Francisco today and the likelihood it'll rain?")
+  parser.add_argument('--serve', action='store_true', help="Answer JSONL conversation messages from stdin on stdout until stdin closes.")
+  parser.add_argument('--workers', type=int, default=16, help="--serve only: number of conversations answered at the same time.")
+  args = parser.parse_args()
+
+  if args.serve:
+    # stdout carries the JSONL responses; everything else is logged to stderr.
+    output_file = sys.stdout
+    sys.stdout = sys.stderr
+    serve(sys.stdin, output_file, args.workers)
+    print("Weather cache", weather.cache.stats())
+    raise SystemExit
 
+  streamed = []
 
+  def print_text(text):
+    if not streamed:
+      print("/\nAssistant Response: ", end="")
+    streamed.append(text)
+    print(text, end="", flush=True)
 
+  trace = RunTrace()
+  answer = ask(args.question, on_text=print_text, trace=trace)
+  print()
+  print("Run trace:", trace.summary())
+  print("Weather cache", weather.cache.stats())
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+DEFAULT_MAX_CONVERSATIONS = 1000
+DEFAULT_IDLE_SECONDS = 30 * 60
+DEFAULT_MAX_PENDING = 4
+
+
+class ConversationBusy(Exception):
+    pass
+
+
+class Conversation:
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        # A thread can only have one active run, so turns of a conversation
+        # take this lock one after another.
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.last_used = time.monotonic()
+
+
+# Maps conversation ids to assistant threads that are reused across turns.
+# Each conversation runs one turn at a time and queues at most max_pending more;
+# conversations idle for idle_seconds, or beyond max_conversations in LRU
+# order, are dropped and their threads deleted.
+class ConversationManager:
+    def __init__(self, create_thread, delete_thread=None, max_pending=DEFAULT_MAX_PENDING, idle_seconds=DEFAULT_IDLE_SECONDS, max_conversations=DEFAULT_MAX_CONVERSATIONS):
+        self.create_thread = create_thread
+        self.delete_thread = delete_thread
+        self.max_pending = max_pending
+        self.idle_seconds = idle_seconds
+        self.max_conversations = max_conversations
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def turn(self, conversation_id):
+        conversation = self._reserve(conversation_id)
+        try:
+            with conversation.lock:
+                if conversation.thread_id is None:
+                    conversation.thread_id = self.create_thread()
+                yield conversation.thread_id
+        finally:
+            with self._lock:
+                conversation.pending -= 1
+                conversation.last_used = time.monotonic()
+            self._delete(self._expire())
+
+    def _reserve(self, conversation_id):
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                # The thread is created on the first turn, outside this lock.
+                conversation = self._conversations[conversation_id] = Conversation(None)
+            # pending counts the running turn too, so max_pending more can queue behind it.
+            if conversation.pending > self.max_pending:
+                raise ConversationBusy(f"Conversation {conversation_id} already has {conversation.pending} messages in flight.")
+            conversation.pending += 1
+            conversation.last_used = time.monotonic()
+            self._conversations.move_to_end(conversation_id)
+            return conversation
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            for conversation_id, conversation in list(self._conversations.items()):
+                over_capacity = len(self._conversations) > self.max_conversations
+                if not over_capacity and now - conversation.last_used < self.idle_seconds:
+                    break
+                # Conversations with a turn running or queued stay.
+                if conversation.pending:
+                    continue
+                del self._conversations[conversation_id]
+                expired.append(conversation)
+        return expired
+
+    def _delete(self, conversations):
+        if self.delete_thread is None:
+            return
+        for conversation in conversations:
+            if conversation.thread_id is None:
+                continue
+            try:
+                self.delete_thread(conversation.thread_id)
+            except Exception as e:
+                print(f"Error deleting thread {conversation.thread_id}: {e}")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._conversations)
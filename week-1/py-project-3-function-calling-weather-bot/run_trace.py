@@ -0,0 +1,36 @@
+import time
+
+
+# Timeline of one run, built from its stream events: when each run status was
+# first seen, when the first answer token arrived and how long tools took.
+# Times are milliseconds since the trace was created.
+class RunTrace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+        self.marks = {}
+        self._seen = set()
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+    def record(self, event):
+        if not event.event.startswith("thread.run.") or event.event.startswith("thread.run.step."):
+            return
+        status = event.event[len("thread.run."):]
+        # requires_action can happen once per tool round; the rest only once.
+        if status in self._seen and status != "requires_action":
+            return
+        self._seen.add(status)
+        self.phases.append((status, self.elapsed_ms()))
+
+    def mark(self, name):
+        self.marks.setdefault(name, self.elapsed_ms())
+
+    def add(self, name, ms):
+        self.marks[name] = round(self.marks.get(name, 0) + ms, 1)
+
+    def summary(self):
+        timeline = " -> ".join(f"{status} {ms}ms" for status, ms in self.phases)
+        marks = ", ".join(f"{name} {ms}ms" for name, ms in self.marks.items())
+        return f"{timeline} ({marks})" if marks else timeline
@@ -0,0 +1,83 @@
+import asyncio
+import inspect
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+DEFAULT_TOOL_TIMEOUT = 10.0
+
+
+# Maps function names the assistant can call to Python callables (plain or
+# async) and runs all tool calls of a required action at the same time.
+class ToolRegistry:
+    def __init__(self, timeout=DEFAULT_TOOL_TIMEOUT):
+        self.timeout = timeout
+        self._tools = {}
+
+    def register(self, description, parameters, name=None, timeout=None):
+        def decorator(fn):
+            self._tools[name or fn.__name__] = {
+                "fn": fn,
+                "description": description,
+                "parameters": parameters,
+                "timeout": timeout or self.timeout
+            }
+            return fn
+        return decorator
+
+    def schemas(self):
+        return [
+            {
+                "type": "function",
+                "function": {"name": name, "description": tool["description"], "parameters": tool["parameters"]}
+            }
+            for name, tool in self._tools.items()
+        ]
+
+    def call(self, name, arguments):
+        fn = self._tools[name]["fn"]
+        if isinstance(arguments, str):
+            arguments = json.loads(arguments or "{}")
+        if inspect.iscoroutinefunction(fn):
+            return asyncio.run(fn(**arguments))
+        return fn(**arguments)
+
+    def execute(self, tool_calls):
+        # Each required action gets its own pool with a worker per call, so calls
+        # start right away and a timeout measures the tool alone. A tool that
+        # hangs only holds its own thread, never a worker other runs wait for.
+        tool_calls = list(tool_calls)
+        executor = ThreadPoolExecutor(max_workers=max(1, len(tool_calls)))
+        futures = []
+        try:
+            for tool_call in tool_calls:
+                name = tool_call.function.name
+                if name not in self._tools:
+                    futures.append((tool_call, None, 0))
+                    continue
+                deadline = time.monotonic() + self._tools[name]["timeout"]
+                futures.append((tool_call, executor.submit(self.call, name, tool_call.function.arguments), deadline))
+
+            tool_outputs = []
+            for tool_call, future, deadline in futures:
+                tool_outputs.append({"tool_call_id": tool_call.id, "output": self._output(tool_call, future, deadline)})
+            return tool_outputs
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _output(self, tool_call, future, deadline):
+        name = tool_call.function.name
+        if future is None:
+            return json.dumps({"error": f"Unknown function {name}."})
+        try:
+            result = future.result(timeout=max(0, deadline - time.monotonic()))
+        except TimeoutError:
+            # A running call can't be interrupted; it finishes on its own thread
+            # and the run goes on without its result.
+            future.cancel()
+            print(f"Tool {name} timed out")
+            return json.dumps({"error": f"{name} timed out."})
+        except Exception as e:
+            print(f"Tool {name} failed: {e}")
+            return json.dumps({"error": str(e)})
+        return result if isinstance(result, str) else json.dumps(result)
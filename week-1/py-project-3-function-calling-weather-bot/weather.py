@@ -0,0 +1,128 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+DEFAULT_TTL_SECONDS = 10 * 60
+DEFAULT_MAX_ENTRIES = 10000
+# Bare city names that mean one particular place, keyed like normalize_location's output.
+DEFAULT_REGIONS = {
+    "san francisco": "san francisco, ca",
+}
+
+
+def normalize_location(location):
+    # "San Francisco, CA.", " san  francisco,ca " and "San Francisco" share one
+    # key. Case, whitespace and punctuation are ignored, but the state or
+    # country is kept, so "Portland, OR" and "Portland, ME" stay apart.
+    parts = [" ".join(re.sub(r"[^\w\s]", " ", part).split()) for part in location.lower().split(",")]
+    key = ", ".join(part for part in parts if part)
+    return DEFAULT_REGIONS.get(key, key)
+
+
+# Caches results per key for ttl seconds. Concurrent lookups of a key that is
+# not cached share a single fetch instead of each calling the upstream.
+# Entries are kept in expiry order, so expired ones are dropped from the front
+# on every insert, and the oldest go first beyond max_entries.
+class TTLCache:
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def get_or_fetch(self, key, fetch):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                self.misses += 1
+                future = self._in_flight[key] = Future()
+                leader = True
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = fetch()
+        except Exception as e:
+            # Failures are not cached; waiting callers get the same error.
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            now = time.monotonic()
+            self._entries.pop(key, None)
+            self._entries[key] = (now + self.ttl, value)
+            while self._entries:
+                oldest = next(iter(self._entries.values()))
+                if oldest[0] > now and len(self._entries) <= self.max_entries:
+                    break
+                self._entries.popitem(last=False)
+            del self._in_flight[key]
+        future.set_result(value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+                "entries": len(self._entries)
+            }
+
+
+# Deterministic local weather: the same city always gets the same values.
+class StubWeatherProvider:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, location):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        seed = int.from_bytes(hashlib.sha256(normalize_location(location).encode("utf-8")).digest()[:4], "little")
+        return {
+            "temperature_c": round(-5 + (seed % 400) / 10, 1),
+            "rain_probability": round((seed >> 12) % 101 / 100, 2)
+        }
+
+
+# Weather lookups for the bot's tools. Temperature and rain probability come
+# from one upstream fetch per city, cached for ttl seconds. The normalized
+# location is only the cache key; the provider gets the location as asked.
+class WeatherService:
+    def __init__(self, provider, ttl=DEFAULT_TTL_SECONDS):
+        self.provider = provider
+        self.cache = TTLCache(ttl)
+
+    def current(self, location):
+        key = normalize_location(location)
+        return self.cache.get_or_fetch(key, lambda: self.provider.fetch(location))
+
+    def temperature(self, location, unit):
+        celsius = self.current(location)["temperature_c"]
+        if unit == "Fahrenheit":
+            return round(celsius * 9 / 5 + 32)
+        return round(celsius)
+
+    def rain_probability(self, location):
+        return self.current(location)["rain_probability"]
@@ -2,6 +2,7 @@ from flask import Flask, request, jsonify, render_template
 import requests
 import os
 from dotenv import load_dotenv
+from upstream import make_session, timed_post, LatencyMetrics, DEFAULT_POOL_SIZE, DEFAULT_RETRIES, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
 
 load_dotenv()
 
@@ -12,6 +13,29 @@ ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 VOICE_ID = "XB0fDUnXU5powFXDhCwa"
 # or use premade voices in elevenlabs like CwhRBWXzGAHq8TQ4Fs17
 
+POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", DEFAULT_POOL_SIZE))
+RETRIES = int(os.getenv("UPSTREAM_RETRIES", DEFAULT_RETRIES))
+TIMEOUT = (
+    float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)),
+    float(os.getenv("UPSTREAM_READ_TIMEOUT", DEFAULT_READ_TIMEOUT)),
+)
+
+openai_session = make_session(POOL_SIZE, RETRIES)
+elevenlabs_session = make_session(POOL_SIZE, RETRIES)
+metrics = LatencyMetrics()
+
+
+def upstream_error(name, error):
+    # Upstream trouble is a bad gateway, not a bug in this app.
+    if isinstance(error, requests.Timeout):
+        return jsonify({"error": f"{name} did not respond in time."}), 504
+    return jsonify({"error": f"Could not reach {name}."}), 502
+
+
+def with_timing(response, upstream, ms):
+    response.headers["Server-Timing"] = f"{upstream};dur={ms:.1f}"
+    return response
+
 
 @app.route("/")
 def index():
@@ -29,8 +53,13 @@ def generate_poetry():
     prompt = f"Write a poem with two verses that includes the following words: {', '.join(words)}. Each verse should be about 4-6 lines and creatively incorporate the words provided."
 
     try:
-        response = requests.post(
+        response, ms = timed_post(
+            openai_session,
+            metrics,
+            "generate-poetry",
+            "openai",
             "https://api.openai.com/v1/chat/completions",
+            TIMEOUT,
             headers={
                 "Authorization": f"Bearer {OPENAI_API_KEY}",
                 "Content-Type": "application/json",
@@ -42,13 +71,20 @@ def generate_poetry():
             },
         )
 
+        if response.status_code == 429 or response.status_code >= 500:
+            print(f"OpenAI API error {response.status_code}: {response.text}")
+            return with_timing(jsonify({"error": f"OpenAI API error ({response.status_code})."}), "openai", ms), 502
+
         response_data = response.json()
         if "choices" in response_data and len(response_data["choices"]) > 0:
             lyrics = response_data["choices"][0]["message"]["content"].strip()
-            return jsonify({"lyrics": lyrics})
+            return with_timing(jsonify({"lyrics": lyrics}), "openai", ms)
         else:
-            return jsonify({"error": "Invalid response from OpenAI API."}), 500
+            return with_timing(jsonify({"error": "Invalid response from OpenAI API."}), "openai", ms), 500
 
+    except requests.RequestException as e:
+        print(f"Error generating poetry: {e}")
+        return upstream_error("OpenAI API", e)
     except Exception as e:
         print(f"Error generating poetry: {e}")
         return jsonify({"error": "Failed to generate poetry."}), 500
@@ -63,8 +99,13 @@ def voice_over():
         return jsonify({"error": "No lyrics provided."}), 400
 
     try:
-        response = requests.post(
+        response, ms = timed_post(
+            elevenlabs_session,
+            metrics,
+            "voice-over",
+            "elevenlabs",
             f"https://api.elevenlabs.io/v1/text-to-speech/{VOICE_ID}",
+            TIMEOUT,
             headers={
                 "xi-api-key": ELEVENLABS_API_KEY,
                 "Content-Type": "application/json",
@@ -82,9 +123,11 @@ def voice_over():
         )
 
         if response.status_code != 200:
+            # Retries are used up at this point; report 429/5xx as a bad gateway.
+            status = 502 if response.status_code == 429 or response.status_code >= 500 else response.status_code
             return (
-                jsonify({"error": f"ElevenLabs API error: {response.text}"}),
-                response.status_code,
+                with_timing(jsonify({"error": f"ElevenLabs API error: {response.text}"}), "elevenlabs", ms),
+                status,
             )
 
         file_path = "./static/generated_audio.mp3"
@@ -93,12 +136,20 @@ def voice_over():
                 if chunk:
                     audio_file.write(chunk)
 
-        return jsonify({"audioUrl": "/static/generated_audio.mp3"})
+        return with_timing(jsonify({"audioUrl": "/static/generated_audio.mp3"}), "elevenlabs", ms)
 
+    except requests.RequestException as e:
+        print(f"Error generating voice-over: {e}")
+        return upstream_error("ElevenLabs API", e)
     except Exception as e:
         print(f"Error generating voice-over: {e}")
         return jsonify({"error": "Failed to generate voice-over."}), 500
 
 
+@app.route("/metrics", methods=["GET"])
+def upstream_metrics():
+    return jsonify(metrics.snapshot())
+
+
 if __name__ == "__main__":
     app.run(port=3000)
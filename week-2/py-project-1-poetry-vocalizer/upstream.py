@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import defaultdict, deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 3
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 60
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Latency percentiles are computed over the most recent calls per route.
+LATENCY_WINDOW = 1000
+
+
+def make_session(pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES, backoff_factor=0.5, backoff_jitter=0.5):
+    # One keep-alive connection pool per upstream. Rate limits, server errors and
+    # failed connects are retried with exponential backoff plus jitter, and
+    # Retry-After is honoured. POST is retried too, since in those cases the
+    # upstream either never got the request or answered it with an error. Read
+    # timeouts and broken responses are not retried: the upstream may still be
+    # generating, and they surface as requests.ReadTimeout / ConnectionError.
+    retry = Retry(
+        total=retries,
+        read=False,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=None,
+        backoff_factor=backoff_factor,
+        backoff_jitter=backoff_jitter,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+# Upstream call latency per route, for the /metrics endpoint.
+class LatencyMetrics:
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._latencies = defaultdict(lambda: deque(maxlen=self.window))
+        self._counts = defaultdict(lambda: {"calls": 0, "errors": 0})
+        self._lock = threading.Lock()
+
+    def record(self, route, upstream, ms, error=False):
+        key = f"{route} {upstream}"
+        with self._lock:
+            self._latencies[key].append(ms)
+            self._counts[key]["calls"] += 1
+            self._counts[key]["errors"] += int(error)
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {}
+            for key, latencies in self._latencies.items():
+                values = sorted(latencies)
+                snapshot[key] = {
+                    **self._counts[key],
+                    "p50_ms": round(percentile(values, 0.5), 1),
+                    "p95_ms": round(percentile(values, 0.95), 1),
+                    "p99_ms": round(percentile(values, 0.99), 1),
+                    "max_ms": round(values[-1], 1),
+                }
+            return snapshot
+
+
+def timed_post(session, metrics, route, upstream, url, timeout, **kwargs):
+    # Returns the response and the time it took, including retries.
+    start = time.perf_counter()
+    try:
+        response = session.post(url, timeout=timeout, **kwargs)
+    except requests.RequestException:
+        metrics.record(route, upstream, (time.perf_counter() - start) * 1000, error=True)
+        raise
+    ms = (time.perf_counter() - start) * 1000
+    metrics.record(route, upstream, ms, error=response.status_code >= 400)
+    return response, ms
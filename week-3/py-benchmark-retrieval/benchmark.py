@@ -0,0 +1,180 @@
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from fakes import CallStats, FakeOpenAI, FakeIndex
+
+PROJECTS = {
+    "hiring": "py-project-1-hiring-app",
+    "rag": "py-project-2-rag-with-parallel-search",
+}
+QUERY_WORDS = 40
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def load_app(name):
+    project_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", PROJECTS[name])
+    sys.path.insert(0, os.path.abspath(project_dir))
+    return importlib.import_module("app"), os.path.abspath(project_dir)
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {}
+    values = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {"p50_ms": float(values[0]), "p95_ms": float(values[1]), "p99_ms": float(values[2])}
+
+
+def counting(chunks, counter):
+    for chunk in chunks:
+        counter["rows"] += len(chunk)
+        yield chunk
+
+
+def sample_queries(app, csv_path, count, seed):
+    # Queries are the opening words of randomly chosen resumes, so every query
+    # has at least one strongly matching resume in the index.
+    resumes = [record["resume"] for record in app.read_resumes(csv_path)]
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(resumes).split()[:QUERY_WORDS]) for _ in range(count)]
+
+
+def run_ingest(app, args, csv_path, manifest_path, stats):
+    counter = {"rows": 0}
+    calls_before = stats.snapshot()
+    start = time.perf_counter()
+    store_options = {"rpm": args.rpm, "tpm": args.tpm} if args.app == "rag" else {}
+    app.ingest(counting(app.parseCSVFile(csv_path, args.sample_size), counter), manifest_path=manifest_path, **store_options)
+    elapsed = time.perf_counter() - start
+    calls = {name: value - calls_before.get(name, 0) for name, value in stats.snapshot().items()}
+    return {
+        "rows": counter["rows"],
+        "seconds": elapsed,
+        "rows_per_sec": counter["rows"] / elapsed if elapsed else 0.0,
+        "api_calls": {name: value for name, value in calls.items() if value},
+    }
+
+
+def run_queries(app, args, queries, stats):
+    calls_before = stats.snapshot()
+    latencies = []
+    query_cache = app.QueryCache() if args.app == "hiring" else None
+    for query in queries:
+        start = time.perf_counter()
+        if args.app == "hiring":
+            app.run_query(query, query_cache, stream=not args.no_stream)
+        else:
+            app.run_query(query, stream=not args.no_stream)
+        latencies.append(time.perf_counter() - start)
+    calls = {name: value - calls_before.get(name, 0) for name, value in stats.snapshot().items()}
+    result = {"queries": len(queries), **percentiles(latencies), "api_calls": {name: value for name, value in calls.items() if value}}
+    if query_cache:
+        result["query_cache"] = query_cache.stats()
+    return result
+
+
+def flatten(report, prefix=""):
+    values = {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[f"{prefix}{key}"] = value
+    return values
+
+
+def compare(report, baseline):
+    current = flatten(report)
+    previous = flatten(baseline)
+    for key in sorted(set(current) | set(previous)):
+        new = current.get(key)
+        old = previous.get(key)
+        if new is None or old is None:
+            print(f"{key:55} {old!s:>12} -> {new!s:>12}")
+        else:
+            change = f"{100 * (new - old) / old:+.1f}%" if old else ""
+            print(f"{key:55} {old:>12.2f} -> {new:>12.2f} {change}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingest and query throughput of the week-3 apps against local fakes.")
+    parser.add_argument('--app', choices=sorted(PROJECTS), default="hiring", help="Which week-3 app to benchmark.")
+    parser.add_argument('--sample-size', type=int, default=0, help="Resumes sampled from Resume.csv; 0 ingests every resume.")
+    parser.add_argument('--queries', type=int, default=50, help="Number of queries to run.")
+    parser.add_argument('--embedding-latency', type=float, default=0.0, help="Seconds added to every embeddings request.")
+    parser.add_argument('--chat-latency', type=float, default=0.0, help="Seconds added to every chat completion before the first token.")
+    parser.add_argument('--token-latency', type=float, default=0.0, help="Seconds per generated answer token.")
+    parser.add_argument('--index-latency', type=float, default=0.0, help="Seconds added to every index call.")
+    parser.add_argument('--chat-rpm', type=int, default=0, help="Reject chat completions above this many per minute with a 429; 0 disables.")
+    parser.add_argument('--rpm', type=int, default=1_000_000, help="rag only: client-side extraction requests-per-minute budget.")
+    parser.add_argument('--tpm', type=int, default=100_000_000, help="rag only: client-side extraction tokens-per-minute budget.")
+    parser.add_argument('--no-stream', action='store_true', help="Request answers without streaming.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for picking the queries.")
+    parser.add_argument('--output', help="Write the report as JSON to this file.")
+    parser.add_argument('--baseline', help="Compare against a report written earlier with --output.")
+    args = parser.parse_args()
+
+    app, project_dir = load_app(args.app)
+    from vector_store import LocalVectorStore
+    from document_store import DocumentStore
+    from embedding_cache import EmbeddingCache
+
+    csv_path = os.path.join(project_dir, "Resume.csv")
+    workdir = tempfile.mkdtemp(prefix="retrieval-benchmark-")
+    stats = CallStats()
+    try:
+        app.connect(
+            FakeOpenAI(stats, args.embedding_latency, args.chat_latency, args.token_latency, chat_rpm=args.chat_rpm),
+            FakeIndex(LocalVectorStore(os.path.join(workdir, "vector_store")), stats, args.index_latency),
+            DocumentStore(os.path.join(workdir, "documents.sqlite3")),
+            EmbeddingCache(os.path.join(workdir, "embedding_cache.sqlite3"))
+        )
+        manifest_path = os.path.join(workdir, "ingest_manifest.json")
+        queries = sample_queries(app, csv_path, args.queries, args.seed)
+
+        # The apps print progress and answers; keep the report readable.
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            ingest = run_ingest(app, args, csv_path, manifest_path, stats)
+            reingest = run_ingest(app, args, csv_path, manifest_path, stats)
+            query = run_queries(app, args, queries, stats)
+
+        report = {
+            "app": args.app,
+            "ingest": ingest,
+            "reingest": reingest,
+            "query": query,
+            "api_calls_total": stats.snapshot(),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            print()
+            compare(report, json.load(baseline_file))
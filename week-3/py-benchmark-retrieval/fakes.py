@@ -0,0 +1,193 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import openai
+
+EMBEDDING_DIMENSION = 1536
+# Real embeddings share a large common component, so unrelated texts still score
+# around 0.7; mixing in a shared direction keeps the apps' 0.75 thresholds meaningful.
+SHARED_COMPONENT_WEIGHT = 1.5
+
+ROLE_WORDS = ["developer", "engineer", "manager", "analyst", "scientist", "consultant", "architect", "tester", "designer", "administrator"]
+SKILL_WORDS = ["python", "java", "sql", "javascript", "aws", "docker", "kubernetes", "react", "hadoop", "spark", "tableau", "excel", "selenium", "linux", "c++", "machine learning"]
+SENIORITY_WORDS = ["junior", "senior", "lead", "principal", "intern", "head"]
+INDUSTRY_WORDS = ["it", "finance", "banking", "healthcare", "insurance", "retail", "telecom", "education", "automotive"]
+
+
+class CallStats:
+    def __init__(self):
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.calls[name] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.calls)
+
+
+# Fixed-rate limiter that rejects instead of waiting, like the real API.
+class RejectingRateLimit:
+    def __init__(self, rpm):
+        self.rpm = rpm
+        self._window_start = time.monotonic()
+        self._requests = 0
+        self._lock = threading.Lock()
+
+    def check(self, stats):
+        if not self.rpm:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 60:
+                self._window_start = now
+                self._requests = 0
+            self._requests += 1
+            if self._requests <= self.rpm:
+                return
+            retry_after = 60 - (now - self._window_start)
+        stats.count("rate_limited")
+        request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+        response = httpx.Response(429, request=request, headers={"retry-after": f"{retry_after:.2f}"})
+        raise openai.RateLimitError("Rate limit reached (fake)", response=response, body=None)
+
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9+#]+", text.lower())
+
+
+# Deterministic bag-of-words embeddings: every word maps to a fixed random
+# vector seeded from its hash, and a text embeds to the normalized sum, so
+# texts that share words are similar the way real embeddings would be.
+class FakeEmbeddings:
+    def __init__(self, stats, latency=0.0, dimension=EMBEDDING_DIMENSION):
+        self.stats = stats
+        self.latency = latency
+        self.dimension = dimension
+        self._word_vectors = {}
+        self._lock = threading.Lock()
+
+    def create(self, input, model):
+        inputs = [input] if isinstance(input, str) else list(input)
+        self.stats.count("embeddings.create")
+        self.stats.count("embedding_inputs", len(inputs))
+        time.sleep(self.latency)
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=self.embed(text).tolist())
+            for i, text in enumerate(inputs)
+        ])
+
+    def embed(self, text):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word, count in Counter(tokenize(text)).items():
+            vector += count * self._word_vector(word)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        vector += SHARED_COMPONENT_WEIGHT * self._word_vector("") / np.sqrt(self.dimension)
+        return vector / np.linalg.norm(vector)
+
+    def _word_vector(self, word):
+        with self._lock:
+            if word not in self._word_vectors:
+                seed = int.from_bytes(hashlib.sha256(word.encode("utf-8")).digest()[:8], "little")
+                self._word_vectors[word] = np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+            return self._word_vectors[word]
+
+
+class FakeChatCompletions:
+    def __init__(self, stats, latency=0.0, token_latency=0.0, answer_tokens=200, rpm=0):
+        self.stats = stats
+        self.latency = latency
+        self.token_latency = token_latency
+        self.answer_tokens = answer_tokens
+        self.rate_limit = RejectingRateLimit(rpm)
+
+    def create(self, model, messages, response_format=None, max_tokens=None, stream=False, **kwargs):
+        self.rate_limit.check(self.stats)
+        self.stats.count("chat.completions.create")
+        time.sleep(self.latency)
+        if response_format:
+            return self._message(json.dumps(extract_categories(messages[-1]["content"])))
+
+        words = [f"token{i}" for i in range(min(self.answer_tokens, max_tokens or self.answer_tokens))]
+        if stream:
+            return self._stream(words)
+        time.sleep(self.token_latency * len(words))
+        return self._message(" ".join(words))
+
+    def _message(self, content):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    def _stream(self, words):
+        for word in words:
+            time.sleep(self.token_latency)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))])
+
+
+def extract_categories(text):
+    # Stands in for the structured-output extraction: picks known keywords
+    # from the text, so the result is deterministic and never empty.
+    lowered = text.lower()
+    words = set(tokenize(text))
+
+    def found(vocabulary, fallback):
+        matches = [word for word in vocabulary if (word in lowered if " " in word else word in words)]
+        return matches or [fallback]
+
+    return {
+        "roles": found(ROLE_WORDS, "software engineer"),
+        "skills": found(SKILL_WORDS, "communication"),
+        "seniority": found(SENIORITY_WORDS, "mid-level"),
+        "industry": found(INDUSTRY_WORDS, "it"),
+    }
+
+
+class FakeOpenAI:
+    def __init__(self, stats, embedding_latency=0.0, chat_latency=0.0, token_latency=0.0, answer_tokens=200, chat_rpm=0):
+        self.embeddings = FakeEmbeddings(stats, embedding_latency)
+        self.chat = SimpleNamespace(completions=FakeChatCompletions(stats, chat_latency, token_latency, answer_tokens, chat_rpm))
+
+    def with_options(self, **options):
+        # The fakes never retry on their own, so options like max_retries are moot.
+        return self
+
+
+# Wraps a LocalVectorStore with a fixed per-call latency to stand in for a
+# remote index, and counts the calls made to it.
+class FakeIndex:
+    def __init__(self, store, stats, latency=0.0):
+        self.store = store
+        self.stats = stats
+        self.latency = latency
+
+    def upsert(self, vectors):
+        self.stats.count("index.upsert")
+        self.stats.count("upserted_vectors", len(vectors))
+        time.sleep(self.latency)
+        return self.store.upsert(vectors)
+
+    def query(self, **kwargs):
+        self.stats.count("index.query")
+        time.sleep(self.latency)
+        return self.store.query(**kwargs)
+
+    def delete(self, **kwargs):
+        self.stats.count("index.delete")
+        time.sleep(self.latency)
+        return self.store.delete(**kwargs)
+
+    def flush(self):
+        self.store.flush()
+
+    def close(self):
+        self.store.close()
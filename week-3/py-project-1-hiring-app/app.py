@@ -1,78 +1,270 @@
 import os
-import pandas as pd
 import openai
-from pinecone import Pinecone
 from dotenv import load_dotenv
 import argparse
+import csv
+import itertools
 import json
+import random
+import sys
+import time
+from upsert_writer import UpsertWriter, DEFAULT_UPSERT_BATCH_SIZE
+from embedding_cache import EmbeddingCache, DEFAULT_CACHE_PATH, DEFAULT_MAX_CACHE_BYTES
+from vector_store import open_vector_store
+from document_store import DocumentStore, DEFAULT_DOCUMENT_STORE_PATH
+from query_cache import QueryCache, normalize_query, DEFAULT_SEMANTIC_THRESHOLD
+from ingest_manifest import resume_id, fingerprint, load_manifest, save_manifest, ManifestDiff, DEFAULT_MANIFEST_PATH
 
 load_dotenv()
-pinecone_api_key = os.getenv("PINECONE_API_KEY")
-pinecone_host = os.getenv("PINECONE_HOST")
-pinecone = Pinecone(api_key=pinecone_api_key, environment=pinecone_host)
-index = pinecone.Index("index3")
-if not pinecone_api_key:
-    raise ValueError("PINECONE_API_KEY environment variable not set!")
-if not pinecone_host:
-    raise ValueError("PINECONE_HOST environment variable not set!")
-
-openai_api_key = os.getenv("OPENAI_API_KEY")
-
-if not openai_api_key:
-    raise ValueError("OPENAI_API_KEY environment variable not set!")
-
-client = openai.OpenAI(api_key=openai_api_key)
-
-def parseCSVFile(csv_path):
-    df = pd.read_csv(csv_path)
-    df = df.drop_duplicates(subset=['Resume'])
-    df = df.sample(frac=1).reset_index(drop=True)  # Shuffle
-    reduced_length = len(df) // 50
-    df = df[:reduced_length]
-    
-    data = [
-        {
-            "id": idx + 1,
-            "resume": row['Resume']
-        }
-        for idx, row in df.iterrows()
-    ]
+client = None
+index = None
+document_store = None
+embedding_cache = None
+
+def connect(openai_client=None, vector_store=None, documents=None, cache=None):
+    # Nothing is opened or validated at import time; anything not passed in
+    # is created from the environment.
+    global client, index, document_store, embedding_cache
+    if openai_client is None:
+        openai_api_key = os.getenv("OPENAI_API_KEY")
+
+        if not openai_api_key:
+            raise ValueError("OPENAI_API_KEY environment variable not set!")
+
+        openai_client = openai.OpenAI(api_key=openai_api_key)
+    client = openai_client
+    # Compared against None: an empty LocalVectorStore is falsy because it has __len__.
+    if vector_store is None:
+        vector_store = open_vector_store()
+    index = vector_store
+    if documents is None:
+        documents = DocumentStore(os.getenv("DOCUMENT_STORE_PATH", DEFAULT_DOCUMENT_STORE_PATH))
+    document_store = documents
+    if cache is None:
+        cache = EmbeddingCache(
+            os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH),
+            int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", DEFAULT_MAX_CACHE_BYTES))
+        )
+    embedding_cache = cache
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+# Resumes are cut to this many estimated tokens before embedding. It stays well
+# under the model's 8191-token input limit because estimate_tokens undercounts
+# symbol-heavy text.
+EMBEDDING_INPUT_TOKENS = 6000
+DEFAULT_EMBEDDING_BATCH_SIZE = 100
+DEFAULT_EMBEDDING_BATCH_TOKENS = 100000
+# Fixed so that the same CSV always yields the same sample, which lets the
+# incremental ingest skip everything that is already in the index.
+SAMPLE_SEED = 42
+# Token budget for the resumes sent to gpt-4o in generate_response.
+DEFAULT_PROMPT_TOKEN_BUDGET = 6000
+DEFAULT_SAMPLE_SIZE = 20
+DEFAULT_CHUNK_SIZE = 100
 
-    return data
+def read_resumes(csv_path):
+    # Streams deduplicated resume records. Only the ids (content hashes) of the
+    # resumes seen so far are kept for deduplication, not their text.
+    csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+    seen = set()
+    with open(csv_path, newline='', encoding='utf-8') as csv_file:
+        for row in csv.DictReader(csv_file):
+            resume = row['Resume']
+            if not resume or not resume.strip():
+                continue
+            record_id = resume_id(resume)
+            if record_id in seen:
+                continue
+            seen.add(record_id)
+            yield {"id": record_id, "resume": resume}
+
+def reservoir_sample(records, sample_size, seed=SAMPLE_SEED):
+    rng = random.Random(seed)
+    sample = []
+    for i, record in enumerate(records):
+        if i < sample_size:
+            sample.append(record)
+        else:
+            j = rng.randint(0, i)
+            if j < sample_size:
+                sample[j] = record
+    return sample
+
+def parseCSVFile(csv_path, sample_size=DEFAULT_SAMPLE_SIZE, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Yields lists of at most chunk_size records. With a sample_size only that
+    # many resumes, drawn uniformly from the whole file, are kept in memory.
+    records = read_resumes(csv_path)
+    if sample_size:
+        records = iter(reservoir_sample(records, sample_size))
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
 
 def generate_embedding(text):
+    embedding = embedding_cache.get(EMBEDDING_MODEL, text)
+    if embedding is not None:
+        return embedding
     response = client.embeddings.create(
         input=text,
-        model="text-embedding-ada-002"  
+        model=EMBEDDING_MODEL
     )        
     embedding = response.data[0].embedding
+    embedding_cache.put(EMBEDDING_MODEL, text, embedding)
     return embedding
 
-def store_embeddings_in_pinecone(data):
-    embedding = ''
-    for i, row in enumerate(data):
-        embedding = generate_embedding(row["resume"])
-        index.upsert([{
-            "id": f"text-{i}",
-            "values": embedding,
-            "metadata": {
+def generate_embeddings(texts):
+    embeddings = embedding_cache.get_many(EMBEDDING_MODEL, texts)
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if not missing:
+        return embeddings
+
+    # The embeddings endpoint accepts a list input; results carry the position
+    # of their input, so sort on it rather than trusting the response order.
+    response = client.embeddings.create(
+        input=[texts[i] for i in missing],
+        model=EMBEDDING_MODEL
+    )
+    fresh = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    embedding_cache.put_many(EMBEDDING_MODEL, [texts[i] for i in missing], fresh)
+    for i, embedding in zip(missing, fresh):
+        embeddings[i] = embedding
+    return embeddings
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text with cl100k_base.
+    return len(text) // 4 + 1
+
+def batch_rows(data, batch_size, max_batch_tokens):
+    batch = []
+    batch_tokens = 0
+    for row in data:
+        tokens = estimate_tokens(row["embedding_input"])
+        if batch and (len(batch) >= batch_size or batch_tokens + tokens > max_batch_tokens):
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append(row)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+def with_embedding_input(data):
+    # A single input over the model limit would fail its whole batch, so long
+    # resumes are shortened; only their beginning ends up in the embedding.
+    for row in data:
+        embedding_input = truncate_to_tokens(row["resume"], EMBEDDING_INPUT_TOKENS)
+        if embedding_input is not row["resume"]:
+            print(f"Resume {row['id']} is longer than {EMBEDDING_INPUT_TOKENS} tokens, embedding its beginning only")
+        yield {**row, "embedding_input": embedding_input}
+
+def embed_rows(data, batch_size=DEFAULT_EMBEDDING_BATCH_SIZE, max_batch_tokens=DEFAULT_EMBEDDING_BATCH_TOKENS):
+    start = time.perf_counter()
+    embedded = 0
+    for batch in batch_rows(with_embedding_input(data), batch_size, max_batch_tokens):
+        embeddings = generate_embeddings([row["embedding_input"] for row in batch])
+        for row, embedding in zip(batch, embeddings):
+            yield row, embedding
+        embedded += len(batch)
+        elapsed = time.perf_counter() - start
+        print(f"Embedded {embedded} rows ({embedded / elapsed:.1f} rows/sec)")
+
+def store_embeddings_in_pinecone(data, batch_size=DEFAULT_EMBEDDING_BATCH_SIZE, max_batch_tokens=DEFAULT_EMBEDDING_BATCH_TOKENS, upsert_batch_size=DEFAULT_UPSERT_BATCH_SIZE):
+    start = time.perf_counter()
+    vector_ids = {}
+    with UpsertWriter(index, batch_size=upsert_batch_size) as writer:
+        for row, embedding in embed_rows(data, batch_size, max_batch_tokens):
+            writer.add({
                 "id": row["id"],
-                "resume": row["resume"]
-            }
-        }])
+                "values": embedding,
+                "metadata": {
+                    "id": row["id"]
+                }
+            })
+            vector_ids[row["id"]] = [row["id"]]
+
+    elapsed = time.perf_counter() - start
+    rate = writer.upserted / elapsed if elapsed else 0
+    print(f"Successfully stored {writer.upserted} data points in Pinecone ({rate:.1f} rows/sec)")
+    print("Embedding cache", embedding_cache.stats())
+    return vector_ids
+
+def resume_fingerprint(row):
+    return fingerprint(EMBEDDING_MODEL, row["resume"])
+
+def ingest(chunks, manifest_path=DEFAULT_MANIFEST_PATH, full=False, **store_options):
+    manifest = {} if full else load_manifest(manifest_path)
+    if full:
+        index.delete(delete_all=True)
+        document_store.clear()
+
+    diff = ManifestDiff(manifest, resume_fingerprint)
+
+    def pending_records():
+        for chunk in chunks:
+            chunk = list(chunk)
+            pending = list(diff.pending(chunk))
+            pending_ids = {record["id"] for record in pending}
+            # Unchanged resumes are stored again if the document store lost them,
+            # e.g. when documents.sqlite3 was deleted but the manifest was kept.
+            unchanged = [record for record in chunk if record["id"] not in pending_ids]
+            stored = document_store.get_many(record["id"] for record in unchanged)
+            missing = [record for record in unchanged if record["id"] not in stored]
+            if missing:
+                print(f"Restoring {len(missing)} resumes missing from the document store")
+            document_store.put_many([(record["id"], record["resume"]) for record in pending + missing])
+            yield from pending
+
+    # An error aborts the ingest before the manifest is saved, so the next run embeds the same resumes again.
+    vector_ids = store_embeddings_in_pinecone(pending_records(), **store_options)
+    for record_id, record_vector_ids in vector_ids.items():
+        manifest[record_id] = {
+            "fingerprint": diff.fingerprints[record_id],
+            "vector_ids": record_vector_ids
+        }
+
+    deleted = diff.deleted()
+    stale_ids = [vector_id for record_id in deleted for vector_id in manifest[record_id]["vector_ids"]]
+    for start in range(0, len(stale_ids), 1000):
+        index.delete(ids=stale_ids[start:start + 1000])
+    document_store.delete_many(deleted)
+    for record_id in deleted:
+        del manifest[record_id]
 
-    print(f"Successfully stored {len(embedding)} data points in Pinecone")
+    print(f"Ingest: {diff.counts['new']} new, {diff.counts['changed']} changed, {len(deleted)} deleted, "
+          f"{diff.counts['unchanged']} unchanged")
+    index.flush()
+    save_manifest(manifest, manifest_path)
 
-def generate_response(query, top_candidates):
-    candidate_data = [
+def truncate_to_tokens(text, max_tokens):
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + "..."
+
+def budget_candidates(candidates, budget_tokens):
+    # Splits the prompt budget across candidates: short resumes are kept whole
+    # and the tokens they leave unused go to the longer ones, which are cut.
+    budgets = {}
+    remaining = budget_tokens
+    ordered = sorted(candidates, key=lambda candidate: estimate_tokens(candidate["resume"]))
+    for i, candidate in enumerate(ordered):
+        share = remaining // (len(ordered) - i)
+        budgets[candidate["id"]] = min(estimate_tokens(candidate["resume"]), share)
+        remaining -= budgets[candidate["id"]]
+    return [
         {
             "id": candidate["id"],
-            "resume": candidate["resume"]
+            "resume": truncate_to_tokens(candidate["resume"], budgets[candidate["id"]])
         }
-        for candidate in top_candidates
+        for candidate in candidates
     ]
 
-    candidates_json = json.dumps(candidate_data)
+def generate_response(query, top_candidates, prompt_token_budget=DEFAULT_PROMPT_TOKEN_BUDGET, stream=False):
+    candidate_data = budget_candidates(top_candidates, prompt_token_budget)
+
+    candidates_json = json.dumps(candidate_data, ensure_ascii=False)
 
     prompt = f"""You are a skilled talent recruiter. You have access to the resumes of the top candidates. Provide a brief summary of each candidate's resume to help your client make an informed decision. Don't skip any candidates—talk about all the candidates you are given.
 
@@ -85,46 +277,106 @@ def generate_response(query, top_candidates):
             {"role": "system", "content": prompt},
             {"role": "user", "content": f"Who are the top candidates for ${query}?"}
         ],
-        max_tokens=1000
+        max_tokens=1000,
+        stream=stream
     )
-    return response.choices[0].message.content
+    if not stream:
+        return response.choices[0].message.content
 
-if __name__ == "__main__":
-    csv_path = "Resume.csv"
-    data = parseCSVFile(csv_path)
-    store_embeddings_in_pinecone(data)
-    parser = argparse.ArgumentParser(description="Chat with OpenAI GPT model via command line.")
-    parser.add_argument('query', type=str, help="The initial query text.")
-    args = parser.parse_args()
-    user_query = args.query
+    # Print tokens as they arrive and return the full text at the end.
+    parts = []
+    for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+            print(chunk.choices[0].delta.content, end="", flush=True)
+    print()
+    return "".join(parts)
 
-    while True:
+def run_query(user_query, query_cache, prompt_token_budget=DEFAULT_PROMPT_TOKEN_BUDGET, stream=True):
+    cache_key = normalize_query(user_query)
+    query_embedding = query_cache.embeddings.get(cache_key)
+    if query_embedding is None:
         query_embedding = generate_embedding(user_query)
+        query_cache.embeddings.put(cache_key, query_embedding)
 
+    matches = query_cache.results.get(cache_key)
+    if matches is None:
         results = index.query(vector=query_embedding, top_k=10, include_metadata=True)
         print("Results", results)
-        score_threshold = 0.75
-        print("Our threshold", score_threshold)
-        top_candidates = []
-        for match in results['matches']:
-            print("Match", match)
-            if match['score'] > score_threshold:
-                top_candidates.append({
-                    "id": match['metadata']['id'],
-                    "score": match['score'],
-                    "resume": match['metadata']['resume']
-                })
-        print(f"Found {len(top_candidates)} top candidates.")
-        print("Ordered by score:")
-        print("\n".join([f"ID: {candidate['id']}, Score: {candidate['score']}" for candidate in top_candidates]))
- 
-        detailed_response = ""
-        if top_candidates:
-            detailed_response = generate_response(user_query, top_candidates)
+        matches = [{"id": match['metadata']['id'], "score": match['score']} for match in results['matches']]
+        query_cache.results.put(cache_key, matches)
+    score_threshold = 0.75
+    print("Our threshold", score_threshold)
+    top_candidates = []
+    for match in matches:
+        print("Match", match)
+        if match['score'] > score_threshold:
+            top_candidates.append(dict(match))
+
+    # Candidates whose resume is missing from the document store are left out
+    # rather than sent to GPT with an empty resume.
+    resumes = document_store.get_many(candidate["id"] for candidate in top_candidates)
+    missing = [candidate["id"] for candidate in top_candidates if candidate["id"] not in resumes]
+    if missing:
+        print(f"Skipping {len(missing)} candidates missing from the document store; run the ingest again.")
+    top_candidates = [
+        {**candidate, "resume": resumes[candidate["id"]]}
+        for candidate in top_candidates
+        if candidate["id"] in resumes
+    ]
+
+    print(f"Found {len(top_candidates)} top candidates.")
+    print("Ordered by score:")
+    print("\n".join([f"ID: {candidate['id']}, Score: {candidate['score']}" for candidate in top_candidates]))
+
+    detailed_response = ""
+    if top_candidates:
+        candidate_ids = frozenset(candidate["id"] for candidate in top_candidates)
+        detailed_response = query_cache.get_response(cache_key, query_embedding, candidate_ids)
+        if detailed_response is not None:
             print(f"Response: {detailed_response}")
         else:
-            detailed_response = "No relevant results found above the threshold."
-            print(detailed_response)
+            if stream:
+                print("Response: ", end="", flush=True)
+                detailed_response = generate_response(user_query, top_candidates, prompt_token_budget, stream=True)
+            else:
+                detailed_response = generate_response(user_query, top_candidates, prompt_token_budget)
+                print(f"Response: {detailed_response}")
+            query_cache.put_response(cache_key, query_embedding, candidate_ids, detailed_response)
+    else:
+        detailed_response = "No relevant results found above the threshold."
+        print(detailed_response)
+    print("Query cache", query_cache.stats())
+    return detailed_response
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chat with OpenAI GPT model via command line.")
+    parser.add_argument('query', type=str, help="The initial query text.")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_EMBEDDING_BATCH_SIZE, help="Maximum resumes per embeddings request.")
+    parser.add_argument('--max-batch-tokens', type=int, default=DEFAULT_EMBEDDING_BATCH_TOKENS, help="Approximate token budget per embeddings request.")
+    parser.add_argument('--upsert-batch-size', type=int, default=DEFAULT_UPSERT_BATCH_SIZE, help="Maximum vectors per Pinecone upsert request.")
+    parser.add_argument('--sample-size', type=int, default=DEFAULT_SAMPLE_SIZE, help="Number of resumes sampled from the CSV; 0 ingests every resume.")
+    parser.add_argument('--full-reingest', action='store_true', help="Clear the index and the ingest manifest, then ingest every resume.")
+    parser.add_argument('--semantic-cache-threshold', type=float, default=DEFAULT_SEMANTIC_THRESHOLD, help="Cosine similarity above which an earlier answer is reused for a reworded query.")
+    parser.add_argument('--prompt-token-budget', type=int, default=DEFAULT_PROMPT_TOKEN_BUDGET, help="Approximate token budget for the resumes sent to GPT.")
+    parser.add_argument('--no-stream', action='store_true', help="Print the answer only once it is complete.")
+    args = parser.parse_args()
+
+    connect()
+    csv_path = "Resume.csv"
+    data = parseCSVFile(csv_path, args.sample_size)
+    ingest(
+        data,
+        full=args.full_reingest,
+        batch_size=args.batch_size,
+        max_batch_tokens=args.max_batch_tokens,
+        upsert_batch_size=args.upsert_batch_size
+    )
+    query_cache = QueryCache(args.semantic_cache_threshold)
+    user_query = args.query
+
+    while True:
+        run_query(user_query, query_cache, args.prompt_token_budget, stream=not args.no_stream)
 
         user_query = input("Enter your next query (or type 'exit' to quit): ")
         if user_query.lower() == 'exit':
@@ -0,0 +1,52 @@
+import sqlite3
+import threading
+
+DEFAULT_DOCUMENT_STORE_PATH = "documents.sqlite3"
+# Reads go through SQLite's memory-mapped I/O for files up to this size.
+MMAP_SIZE = 1024 * 1024 * 1024
+
+
+# Resume bodies keyed by resume id. Vector metadata only carries the id, and
+# the text is looked up here for the few candidates that make it into a prompt.
+class DocumentStore:
+    def __init__(self, path=DEFAULT_DOCUMENT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, body TEXT NOT NULL)")
+        self._conn.commit()
+
+    def put_many(self, documents):
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO documents VALUES (?, ?)", documents)
+            self._conn.commit()
+
+    def get(self, document_id):
+        return self.get_many([document_id]).get(document_id)
+
+    def get_many(self, document_ids):
+        documents = {}
+        document_ids = list(document_ids)
+        with self._lock:
+            for start in range(0, len(document_ids), 500):
+                chunk = document_ids[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(f"SELECT id, body FROM documents WHERE id IN ({placeholders})", chunk)
+                documents.update(rows)
+        return documents
+
+    def delete_many(self, document_ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM documents WHERE id = ?", [(document_id,) for document_id in document_ids])
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM documents")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,107 @@
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_SEMANTIC_THRESHOLD = 0.95
+
+
+def normalize_query(text):
+    return " ".join(text.lower().split())
+
+
+class LRUCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+# Reuses a generated answer for a different wording of an earlier query: the
+# new query embedding has to be within `threshold` cosine similarity of the
+# old one, and the search has to have returned exactly the same candidates.
+class SemanticCache:
+    def __init__(self, threshold=DEFAULT_SEMANTIC_THRESHOLD, max_entries=DEFAULT_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._embeddings = np.empty((0, 0), dtype=np.float32)
+        self._entries = []
+
+    def get(self, embedding, candidate_ids):
+        if self._entries:
+            scores = self._embeddings @ self._normalize(embedding)
+            for position in np.argsort(-scores):
+                if scores[position] < self.threshold:
+                    break
+                if self._entries[position][0] == candidate_ids:
+                    self.hits += 1
+                    return self._entries[position][1]
+        self.misses += 1
+        return None
+
+    def put(self, embedding, candidate_ids, value):
+        vector = self._normalize(embedding)[np.newaxis, :]
+        self._embeddings = vector if not self._entries else np.vstack([self._embeddings, vector])
+        self._entries.append((candidate_ids, value))
+        if len(self._entries) > self.max_entries:
+            self._embeddings = self._embeddings[1:]
+            self._entries.pop(0)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def _normalize(self, embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+# Tiered cache for the interactive search loop: exact-match LRUs on the
+# normalized query text for embeddings, search results and answers, and a
+# semantic cache for answers to near-identical queries.
+class QueryCache:
+    def __init__(self, semantic_threshold=DEFAULT_SEMANTIC_THRESHOLD, max_entries=DEFAULT_MAX_ENTRIES):
+        self.embeddings = LRUCache(max_entries)
+        self.results = LRUCache(max_entries)
+        self.responses = LRUCache(max_entries)
+        self.semantic_responses = SemanticCache(semantic_threshold, max_entries)
+
+    def get_response(self, query, embedding, candidate_ids):
+        response = self.responses.get((query, candidate_ids))
+        if response is None:
+            response = self.semantic_responses.get(embedding, candidate_ids)
+        return response
+
+    def put_response(self, query, embedding, candidate_ids, response):
+        self.responses.put((query, candidate_ids), response)
+        self.semantic_responses.put(embedding, candidate_ids, response)
+
+    def stats(self):
+        return {
+            "embeddings": self.embeddings.stats(),
+            "results": self.results.stats(),
+            "responses": self.responses.stats(),
+            "semantic_responses": self.semantic_responses.stats(),
+        }
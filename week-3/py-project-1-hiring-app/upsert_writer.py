@@ -0,0 +1,98 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_UPSERT_BATCH_SIZE = 100
+# Pinecone rejects upsert requests above 2MB; leave headroom for the envelope.
+DEFAULT_MAX_REQUEST_BYTES = 2 * 1024 * 1024 - 64 * 1024
+DEFAULT_MAX_IN_FLIGHT = 4
+UPSERT_RETRIES = 3
+
+
+def estimate_vector_bytes(vector):
+    # Float values serialize to roughly 20 characters each in the JSON request body.
+    metadata = vector.get("metadata") or {}
+    return len(vector["id"]) + 20 * len(vector["values"]) + len(json.dumps(metadata))
+
+
+# Buffers vectors and upserts them in size-bounded batches on a thread pool.
+# flush() / close() wait until every buffered vector is written and re-raise
+# the error of any batch that could not be stored.
+class UpsertWriter:
+
+    def __init__(self, index, batch_size=DEFAULT_UPSERT_BATCH_SIZE, max_request_bytes=DEFAULT_MAX_REQUEST_BYTES, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        self.index = index
+        self.batch_size = batch_size
+        self.max_request_bytes = max_request_bytes
+        self.upserted = 0
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._futures = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+
+    def add(self, vector):
+        size = estimate_vector_bytes(vector)
+        with self._lock:
+            if self._buffer and (len(self._buffer) >= self.batch_size or self._buffer_bytes + size > self.max_request_bytes):
+                self._submit()
+            self._buffer.append(vector)
+            self._buffer_bytes += size
+
+    def flush(self):
+        with self._lock:
+            if self._buffer:
+                self._submit()
+            futures = self._futures
+            self._futures = []
+        for future in futures:
+            self.upserted += future.result()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._executor.shutdown(wait=True)
+
+    def _submit(self):
+        batch = self._buffer
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._collect_done()
+        # Blocks the producer once max_in_flight batches are pending.
+        self._slots.acquire()
+        self._futures.append(self._executor.submit(self._upsert, batch))
+
+    def _collect_done(self):
+        pending = []
+        for future in self._futures:
+            if future.done():
+                self.upserted += future.result()
+            else:
+                pending.append(future)
+        self._futures = pending
+
+    def _upsert(self, batch):
+        try:
+            for attempt in range(UPSERT_RETRIES):
+                try:
+                    self.index.upsert(batch)
+                    return len(batch)
+                except Exception as e:
+                    if attempt == UPSERT_RETRIES - 1:
+                        raise
+                    print(f"Upsert of {len(batch)} vectors failed ({e}), retrying")
+                    time.sleep(2 ** attempt)
+        finally:
+            self._slots.release()
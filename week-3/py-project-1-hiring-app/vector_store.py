@@ -0,0 +1,300 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from ann_index import IVFIndex, DEFAULT_NPROBE
+
+DEFAULT_STORE_PATH = "vector_store"
+DEFAULT_DIMENSION = 1536
+INITIAL_CAPACITY = 1024
+# Metadata fields that get a row-index array per value, so filtered queries
+# only score the matching rows.
+INDEXED_FIELDS = ("category",)
+# Below this many vectors exact search is fast enough that an IVF index is not built.
+MIN_ANN_ROWS = 1000
+# The IVF index is retrained once the store has grown this much since training.
+ANN_RETRAIN_GROWTH = 4
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def filter_values(condition):
+    # Supports the Pinecone equality forms: {"field": value}, {"$eq": value} and {"$in": [...]}.
+    if isinstance(condition, dict):
+        if "$eq" in condition:
+            return [condition["$eq"]]
+        if "$in" in condition:
+            return list(condition["$in"])
+        raise ValueError(f"Unsupported filter operator: {condition}")
+    return [condition]
+
+
+def top_k_rows(scores, top_k):
+    k = min(top_k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+# In-process replacement for a Pinecone index. Vectors are L2-normalized and
+# kept in one float32 matrix memory-mapped from <path>/vectors.npy, so cosine
+# similarity for every row is a single matrix-vector product. Ids and metadata
+# live in <path>/metadata.json and are written by flush().
+#
+# With index_type="ivf" queries only score the rows of the nprobe closest IVF
+# lists (see ann_index.py); the index is built by flush() once the store holds
+# MIN_ANN_ROWS vectors and is kept up to date on upsert/delete after that.
+class LocalVectorStore:
+    def __init__(self, path=DEFAULT_STORE_PATH, dimension=DEFAULT_DIMENSION, indexed_fields=INDEXED_FIELDS, index_type="flat", nprobe=DEFAULT_NPROBE):
+        self.path = path
+        self.indexed_fields = indexed_fields
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.ann = None
+        self._lock = threading.RLock()
+        self._vectors_path = os.path.join(path, "vectors.npy")
+        self._metadata_path = os.path.join(path, "metadata.json")
+        self._ann_path = os.path.join(path, "ivf.npz")
+        os.makedirs(path, exist_ok=True)
+
+        if os.path.exists(self._metadata_path):
+            with open(self._metadata_path, "r", encoding="utf-8") as metadata_file:
+                state = json.load(metadata_file)
+            self.ids = state["ids"]
+            self.metadata = state["metadata"]
+            self.matrix = np.load(self._vectors_path, mmap_mode="r+")
+        else:
+            self.ids = []
+            self.metadata = []
+            self.matrix = np.lib.format.open_memmap(
+                self._vectors_path, mode="w+", dtype=np.float32, shape=(INITIAL_CAPACITY, dimension)
+            )
+        self.dimension = self.matrix.shape[1]
+
+        self._rows = {vector_id: row for row, vector_id in enumerate(self.ids) if vector_id is not None}
+        self._free = [row for row, vector_id in enumerate(self.ids) if vector_id is None]
+        self._live = np.zeros(len(self.matrix), dtype=bool)
+        self._live[list(self._rows.values())] = True
+        self._postings = {}
+        self._posting_arrays = {}
+        for row in self._rows.values():
+            self._index_row(row)
+        if index_type == "ivf" and len(self) >= MIN_ANN_ROWS and os.path.exists(self._ann_path):
+            self.ann = IVFIndex.load(self._ann_path, nprobe)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def upsert(self, vectors):
+        values = normalize([vector["values"] for vector in vectors])
+        with self._lock:
+            rows = []
+            for vector, normalized in zip(vectors, values):
+                row = self._rows.get(vector["id"])
+                if row is None:
+                    row = self._allocate_row()
+                    self._rows[vector["id"]] = row
+                    self.ids[row] = vector["id"]
+                else:
+                    self._unindex_row(row)
+                self.matrix[row] = normalized
+                self.metadata[row] = vector.get("metadata") or {}
+                self._live[row] = True
+                self._index_row(row)
+                rows.append(row)
+            if self.ann is not None:
+                self.ann.add(rows, values)
+        return {"upserted_count": len(vectors)}
+
+    def query(self, vector, top_k=10, include_metadata=False, include_values=False, filter=None, nprobe=None, exact=False):
+        query_vector = normalize(vector)
+        with self._lock:
+            rows = self._filter_rows(filter)
+            if self.ann is not None and not exact:
+                candidates = self.ann.candidate_rows(query_vector, nprobe)
+                candidates = candidates[self._live[candidates]]
+                rows = candidates if rows is None else np.intersect1d(candidates, rows, assume_unique=True)
+                scores = self.matrix[rows] @ query_vector
+            elif rows is None:
+                count = len(self.ids)
+                scores = self.matrix[:count] @ query_vector
+                scores[~self._live[:count]] = -np.inf
+                rows = np.arange(count)
+            else:
+                scores = self.matrix[rows] @ query_vector
+
+            matches = []
+            for position in top_k_rows(scores, top_k):
+                if scores[position] == -np.inf:
+                    break
+                row = rows[position]
+                match = {"id": self.ids[row], "score": float(scores[position])}
+                if include_metadata:
+                    match["metadata"] = self.metadata[row]
+                if include_values:
+                    match["values"] = self.matrix[row].tolist()
+                matches.append(match)
+        return {"matches": matches}
+
+    def delete(self, ids=None, delete_all=False, filter=None):
+        with self._lock:
+            if delete_all:
+                rows = list(self._rows.values())
+                # Trained on vectors that are gone; flush() trains a new one once enough come back.
+                self._drop_ann()
+            elif filter is not None:
+                rows = self._filter_rows(filter).tolist()
+            else:
+                rows = [self._rows[vector_id] for vector_id in ids or [] if vector_id in self._rows]
+            if self.ann is not None:
+                self.ann.remove(rows)
+            for row in rows:
+                self._unindex_row(row)
+                del self._rows[self.ids[row]]
+                self.ids[row] = None
+                self.metadata[row] = None
+                self._live[row] = False
+                self._free.append(row)
+        return {}
+
+    def build_ann(self, nlist=None):
+        with self._lock:
+            rows = np.array(sorted(self._rows.values()), dtype=np.int64)
+            self.ann = IVFIndex.train(self.matrix[rows], nlist, self.nprobe)
+            self.ann.add(rows, self.matrix[rows])
+            self.ann.save(self._ann_path)
+            print(f"Built IVF index with {self.ann.nlist} lists over {len(rows)} vectors")
+
+    def flush(self):
+        with self._lock:
+            if self.index_type == "ivf" and len(self) >= MIN_ANN_ROWS:
+                if self.ann is None or len(self) > ANN_RETRAIN_GROWTH * self.ann.trained_count:
+                    self.build_ann()
+                else:
+                    self.ann.save(self._ann_path)
+            else:
+                # Small stores use exact search, and a saved index must not outlive its rows.
+                self._drop_ann()
+            self.matrix.flush()
+            tmp_path = self._metadata_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as metadata_file:
+                json.dump({"ids": self.ids, "metadata": self.metadata}, metadata_file)
+            os.replace(tmp_path, self._metadata_path)
+
+    def close(self):
+        self.flush()
+
+    def _drop_ann(self):
+        self.ann = None
+        if os.path.exists(self._ann_path):
+            os.remove(self._ann_path)
+
+    def _allocate_row(self):
+        if self._free:
+            return self._free.pop()
+        row = len(self.ids)
+        if row >= len(self.matrix):
+            self._grow(2 * len(self.matrix))
+        self.ids.append(None)
+        self.metadata.append(None)
+        return row
+
+    def _grow(self, capacity):
+        tmp_path = self._vectors_path + ".tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(capacity, self.dimension))
+        grown[:len(self.matrix)] = self.matrix
+        grown.flush()
+        del grown
+        del self.matrix
+        os.replace(tmp_path, self._vectors_path)
+        self.matrix = np.load(self._vectors_path, mmap_mode="r+")
+        live = np.zeros(capacity, dtype=bool)
+        live[:len(self._live)] = self._live
+        self._live = live
+
+    def _index_row(self, row):
+        for field in self.indexed_fields:
+            if field in self.metadata[row]:
+                key = (field, self.metadata[row][field])
+                self._postings.setdefault(key, set()).add(row)
+                self._posting_arrays.pop(key, None)
+
+    def _unindex_row(self, row):
+        for field in self.indexed_fields:
+            if field in self.metadata[row]:
+                key = (field, self.metadata[row][field])
+                self._postings.get(key, set()).discard(row)
+                self._posting_arrays.pop(key, None)
+
+    def _posting_array(self, key):
+        if key not in self._posting_arrays:
+            self._posting_arrays[key] = np.array(sorted(self._postings.get(key, ())), dtype=np.int64)
+        return self._posting_arrays[key]
+
+    def _filter_rows(self, filter):
+        if not filter:
+            return None
+        rows = None
+        for field, condition in filter.items():
+            values = filter_values(condition)
+            if field in self.indexed_fields and len(values) == 1:
+                matched = self._posting_array((field, values[0]))
+            elif field in self.indexed_fields:
+                matched = np.unique(np.concatenate([self._posting_array((field, value)) for value in values]))
+            else:
+                matched = np.array(sorted(
+                    row for row in self._rows.values() if self.metadata[row].get(field) in values
+                ), dtype=np.int64)
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        return rows
+
+
+class PineconeVectorStore:
+    def __init__(self, index):
+        self.index = index
+
+    def upsert(self, vectors):
+        return self.index.upsert(vectors=vectors)
+
+    def query(self, **kwargs):
+        return self.index.query(**kwargs)
+
+    def delete(self, **kwargs):
+        return self.index.delete(**kwargs)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# VECTOR_STORE selects the backend: "pinecone" (default) or "local".
+def open_vector_store(backend=None):
+    backend = backend or os.getenv("VECTOR_STORE", "pinecone")
+    if backend == "local":
+        return LocalVectorStore(
+            os.getenv("LOCAL_VECTOR_STORE_PATH", DEFAULT_STORE_PATH),
+            index_type=os.getenv("LOCAL_VECTOR_INDEX", "flat"),
+            nprobe=int(os.getenv("IVF_NPROBE", DEFAULT_NPROBE))
+        )
+    if backend == "pinecone":
+        from pinecone import Pinecone
+
+        pinecone_api_key = os.getenv("PINECONE_API_KEY")
+        pinecone_host = os.getenv("PINECONE_HOST")
+        if not pinecone_api_key:
+            raise ValueError("PINECONE_API_KEY environment variable not set!")
+        if not pinecone_host:
+            raise ValueError("PINECONE_HOST environment variable not set!")
+        pinecone = Pinecone(api_key=pinecone_api_key, environment=pinecone_host)
+        return PineconeVectorStore(pinecone.Index(os.getenv("PINECONE_INDEX", "index3")))
+    raise ValueError(f"Unknown VECTOR_STORE backend: {backend}")
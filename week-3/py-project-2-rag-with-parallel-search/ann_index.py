@@ -0,0 +1,163 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+DEFAULT_NPROBE = 8
+KMEANS_ITERATIONS = 20
+# k-means gets a sample this large at most; more rows barely move the centroids.
+MAX_TRAINING_ROWS = 50000
+
+
+def default_nlist(count):
+    return max(1, int(4 * np.sqrt(count)))
+
+
+# IVF-flat index over the rows of a LocalVectorStore matrix. Rows are assigned
+# to the nearest of nlist k-means centroids; a query only scores the rows in
+# the nprobe lists whose centroids are closest to it. Scores themselves are
+# still exact cosine similarities, so score thresholds mean the same thing as
+# with exact search — only recall changes with nprobe.
+class IVFIndex:
+    def __init__(self, centroids, nprobe=DEFAULT_NPROBE):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.trained_count = 0
+        self._lists = {}
+        self._list_arrays = {}
+
+    @classmethod
+    def train(cls, vectors, nlist=None, nprobe=DEFAULT_NPROBE, seed=0):
+        rng = np.random.default_rng(seed)
+        trained_count = len(vectors)
+        if len(vectors) > MAX_TRAINING_ROWS:
+            vectors = vectors[np.sort(rng.choice(len(vectors), MAX_TRAINING_ROWS, replace=False))]
+        vectors = np.asarray(vectors, dtype=np.float32)
+        nlist = min(nlist or default_nlist(len(vectors)), len(vectors))
+
+        # Spherical k-means: vectors are unit length, so assign by dot product
+        # and re-normalize the centroids after every update.
+        centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            for cluster in range(nlist):
+                members = vectors[assignments == cluster]
+                if len(members):
+                    centroids[cluster] = members.mean(axis=0)
+                else:
+                    centroids[cluster] = vectors[rng.integers(len(vectors))]
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            centroids /= norms
+
+        index = cls(centroids, nprobe)
+        index.trained_count = trained_count
+        return index
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def add(self, rows, vectors):
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        self.remove(rows)
+        if rows.max() >= len(self.assignments):
+            grown = np.full(max(rows.max() + 1, 2 * len(self.assignments)), -1, dtype=np.int32)
+            grown[:len(self.assignments)] = self.assignments
+            self.assignments = grown
+        clusters = np.argmax(np.asarray(vectors, dtype=np.float32) @ self.centroids.T, axis=1)
+        self.assignments[rows] = clusters
+        for row, cluster in zip(rows.tolist(), clusters.tolist()):
+            self._lists.setdefault(cluster, set()).add(row)
+            self._list_arrays.pop(cluster, None)
+
+    def remove(self, rows):
+        for row in np.asarray(rows, dtype=np.int64).tolist():
+            if row < len(self.assignments) and self.assignments[row] >= 0:
+                cluster = int(self.assignments[row])
+                self._lists[cluster].discard(row)
+                self._list_arrays.pop(cluster, None)
+                self.assignments[row] = -1
+
+    def candidate_rows(self, query_vector, nprobe=None):
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        scores = self.centroids @ query_vector
+        probes = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        arrays = [self._list_array(int(cluster)) for cluster in probes]
+        return np.sort(np.concatenate(arrays)) if arrays else np.empty(0, dtype=np.int64)
+
+    def save(self, path):
+        np.savez(path, centroids=self.centroids, assignments=self.assignments, trained_count=self.trained_count)
+
+    @classmethod
+    def load(cls, path, nprobe=DEFAULT_NPROBE):
+        state = np.load(path)
+        index = cls(state["centroids"], nprobe)
+        index.trained_count = int(state["trained_count"])
+        index.assignments = state["assignments"].astype(np.int32)
+        for row in np.flatnonzero(index.assignments >= 0).tolist():
+            index._lists.setdefault(int(index.assignments[row]), set()).add(row)
+        return index
+
+    def _list_array(self, cluster):
+        if cluster not in self._list_arrays:
+            self._list_arrays[cluster] = np.array(sorted(self._lists.get(cluster, ())), dtype=np.int64)
+        return self._list_arrays[cluster]
+
+
+# Compares IVF results against exact search for a sample of stored vectors.
+# recall@k is the share of the exact top-k ids the IVF search also returns;
+# threshold recall is the share of exact matches above score_threshold that
+# are still found, which is what the hiring app's candidate cut-off sees.
+def evaluate_recall(store, nprobe, k=10, score_threshold=0.75, sample_size=200, filter=None, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = list(store._rows.values())
+    sample = rng.choice(rows, min(sample_size, len(rows)), replace=False)
+    found = 0
+    expected = 0
+    above_found = 0
+    above_expected = 0
+    latencies = []
+    for row in sample:
+        query_vector = np.array(store.matrix[row])
+        exact = store.query(vector=query_vector, top_k=k, filter=filter, exact=True)["matches"]
+        start = time.perf_counter()
+        approximate = store.query(vector=query_vector, top_k=k, filter=filter, nprobe=nprobe)["matches"]
+        latencies.append(time.perf_counter() - start)
+
+        approximate_ids = {match["id"] for match in approximate}
+        found += sum(match["id"] in approximate_ids for match in exact)
+        expected += len(exact)
+        above = [match for match in exact if match["score"] > score_threshold]
+        above_found += sum(match["id"] in approximate_ids for match in above)
+        above_expected += len(above)
+    return {
+        "nprobe": nprobe,
+        f"recall@{k}": found / expected if expected else 1.0,
+        "threshold_recall": above_found / above_expected if above_expected else 1.0,
+        "mean_latency_ms": 1000 * float(np.mean(latencies)) if latencies else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    from vector_store import LocalVectorStore, DEFAULT_STORE_PATH
+
+    parser = argparse.ArgumentParser(description="Measure IVF recall@k against exact search on a local vector store.")
+    parser.add_argument('--path', default=os.getenv("LOCAL_VECTOR_STORE_PATH", DEFAULT_STORE_PATH), help="Local vector store directory.")
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32], help="nprobe values to try.")
+    parser.add_argument('--nlist', type=int, default=None, help="Retrain the index with this many lists first.")
+    parser.add_argument('--category', default=None, help="Only search vectors of this category.")
+    parser.add_argument('--samples', type=int, default=200, help="Number of stored vectors used as queries.")
+    args = parser.parse_args()
+
+    store = LocalVectorStore(args.path, index_type="ivf")
+    if args.nlist or store.ann is None:
+        store.build_ann(args.nlist)
+    print(f"{len(store)} vectors, {store.ann.nlist} lists")
+    query_filter = {"category": args.category} if args.category else None
+    for nprobe in args.nprobe:
+        print(evaluate_recall(store, nprobe, sample_size=args.samples, filter=query_filter))
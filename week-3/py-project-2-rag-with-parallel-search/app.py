@@ -1,49 +1,132 @@
 import os
-import pandas as pd
 import openai
-from pinecone import Pinecone
 from dotenv import load_dotenv
 import argparse
+import csv
+import itertools
 import json
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from upsert_writer import UpsertWriter, DEFAULT_UPSERT_BATCH_SIZE
+from embedding_cache import EmbeddingCache, DEFAULT_CACHE_PATH, DEFAULT_MAX_CACHE_BYTES
+from rate_limit import RateLimiter, call_with_backoff
+from vector_store import open_vector_store
+from document_store import DocumentStore, DEFAULT_DOCUMENT_STORE_PATH
+from fusion import fuse, match_arrays, parse_weights, FUSION_METHODS
+from ingest_manifest import resume_id, fingerprint, load_manifest, save_manifest, ManifestDiff, DEFAULT_MANIFEST_PATH
 
 load_dotenv()
-pinecone_api_key = os.getenv("PINECONE_API_KEY")
-pinecone_host = os.getenv("PINECONE_HOST")
-pinecone = Pinecone(api_key=pinecone_api_key, environment=pinecone_host)
-index = pinecone.Index("index3")
-if not pinecone_api_key:
-    raise ValueError("PINECONE_API_KEY environment variable not set!")
-if not pinecone_host:
-    raise ValueError("PINECONE_HOST environment variable not set!")
-
-openai_api_key = os.getenv("OPENAI_API_KEY")
-
-if not openai_api_key:
-    raise ValueError("OPENAI_API_KEY environment variable not set!")
-
-client = openai.OpenAI(api_key=openai_api_key)
-
-def parseCSVFile(csv_path):
-    df = pd.read_csv(csv_path)
-    df = df.drop_duplicates(subset=['Resume'])
-    df = df.sample(frac=1).reset_index(drop=True)  # Shuffle
-    reduced_length = len(df) // 50
-    df = df[:reduced_length]
-    
-    data = [
-        {
-            "id": idx + 1,
-            "resume": row['Resume']
-        }
-        for idx, row in df.iterrows()
-    ]
+client = None
+index = None
+document_store = None
+embedding_cache = None
 
-    return data
+def connect(openai_client=None, vector_store=None, documents=None, cache=None):
+    # Nothing is opened or validated at import time; anything not passed in
+    # is created from the environment.
+    global client, index, document_store, embedding_cache
+    if openai_client is None:
+        openai_api_key = os.getenv("OPENAI_API_KEY")
 
+        if not openai_api_key:
+            raise ValueError("OPENAI_API_KEY environment variable not set!")
 
-def extract_categories_from_text(text):
-    response = openai.chat.completions.create(
-        model="gpt-4o",
+        openai_client = openai.OpenAI(api_key=openai_api_key)
+    client = openai_client
+    # Compared against None: an empty LocalVectorStore is falsy because it has __len__.
+    if vector_store is None:
+        vector_store = open_vector_store()
+    index = vector_store
+    if documents is None:
+        documents = DocumentStore(os.getenv("DOCUMENT_STORE_PATH", DEFAULT_DOCUMENT_STORE_PATH))
+    document_store = documents
+    if cache is None:
+        cache = EmbeddingCache(
+            os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH),
+            int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", DEFAULT_MAX_CACHE_BYTES))
+        )
+    embedding_cache = cache
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EXTRACTION_MODEL = "gpt-4o"
+# Fixed so that the same CSV always yields the same sample, which lets the
+# incremental ingest skip everything that is already in the index.
+SAMPLE_SEED = 42
+# Token budget for the resumes sent to gpt-4o in generate_response.
+DEFAULT_PROMPT_TOKEN_BUDGET = 6000
+DEFAULT_SAMPLE_SIZE = 20
+DEFAULT_CHUNK_SIZE = 100
+DEFAULT_EXTRACTION_CONCURRENCY = 8
+DEFAULT_EXTRACTION_RPM = 500
+DEFAULT_EXTRACTION_TPM = 30000
+# Upper bound for the structured output of one extraction, counted against TPM.
+EXTRACTION_OUTPUT_TOKENS = 500
+# The errors the SDK would retry on its own: rate limits, 5xx, timeouts and dropped connections.
+EXTRACTION_RETRY_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APITimeoutError, openai.APIConnectionError)
+CATEGORIES = ['roles', 'skills', 'seniority', 'industry']
+
+query_executor = ThreadPoolExecutor(max_workers=len(CATEGORIES))
+
+def read_resumes(csv_path):
+    # Streams deduplicated resume records. Only the ids (content hashes) of the
+    # resumes seen so far are kept for deduplication, not their text.
+    csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+    seen = set()
+    with open(csv_path, newline='', encoding='utf-8') as csv_file:
+        for row in csv.DictReader(csv_file):
+            resume = row['Resume']
+            if not resume or not resume.strip():
+                continue
+            record_id = resume_id(resume)
+            if record_id in seen:
+                continue
+            seen.add(record_id)
+            yield {"id": record_id, "resume": resume}
+
+def reservoir_sample(records, sample_size, seed=SAMPLE_SEED):
+    rng = random.Random(seed)
+    sample = []
+    for i, record in enumerate(records):
+        if i < sample_size:
+            sample.append(record)
+        else:
+            j = rng.randint(0, i)
+            if j < sample_size:
+                sample[j] = record
+    return sample
+
+def parseCSVFile(csv_path, sample_size=DEFAULT_SAMPLE_SIZE, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Yields lists of at most chunk_size records. With a sample_size only that
+    # many resumes, drawn uniformly from the whole file, are kept in memory.
+    records = read_resumes(csv_path)
+    if sample_size:
+        records = iter(reservoir_sample(records, sample_size))
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text with o200k_base.
+    return len(text) // 4 + 1
+
+def extract_categories_from_text(text, rate_limiter=None):
+    # call_with_backoff is the only retry layer: the SDK's own retries are off,
+    # and every attempt, retries included, is charged to the rate limiter.
+    extraction_client = client.with_options(max_retries=0)
+
+    def create(**kwargs):
+        if rate_limiter:
+            rate_limiter.acquire(estimate_tokens(text) + EXTRACTION_OUTPUT_TOKENS)
+        return extraction_client.chat.completions.create(**kwargs)
+
+    response = call_with_backoff(
+        create,
+        retry_on=EXTRACTION_RETRY_ERRORS,
+        model=EXTRACTION_MODEL,
         messages=[
             {
                 "role": "system",
@@ -100,49 +183,169 @@ Resume:
     print("extractedData:", extracted_data)
     return extracted_data
 
+def extract_categories_concurrently(texts, concurrency=DEFAULT_EXTRACTION_CONCURRENCY, rate_limiter=None):
+    # Yields (text, categories) in completion order. Only a small window of
+    # extractions is queued ahead of the consumer, so downstream embedding and
+    # upserts overlap with the remaining extractions.
+    def extract(text):
+        try:
+            return text, extract_categories_from_text(text['resume'], rate_limiter)
+        except Exception as e:
+            print(f"Failed to extract categories for {text['id']}: {e}")
+            return text, None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = set()
+        for text in texts:
+            pending.add(executor.submit(extract, text))
+            if len(pending) >= concurrency * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
 def generate_category_embeddings(categories):
-    embeddings = {}
+    contents = {category: ", ".join(text) for category, text in categories.items()}
+    cached = embedding_cache.get_many(EMBEDDING_MODEL, list(contents.values()))
+    embeddings = dict(zip(contents, cached))
 
-    for category, text in categories.items():
-        response = openai.embeddings.create(
-            input=", ".join(text),
-            model="text-embedding-ada-002"
+    # All uncached categories go out in one embeddings request.
+    missing = [category for category, embedding in embeddings.items() if embedding is None]
+    if missing:
+        response = client.embeddings.create(
+            input=[contents[category] for category in missing],
+            model=EMBEDDING_MODEL
+        )
+        for category, item in zip(missing, sorted(response.data, key=lambda item: item.index)):
+            embeddings[category] = item.embedding
+        embedding_cache.put_many(
+            EMBEDDING_MODEL,
+            [contents[category] for category in missing],
+            [embeddings[category] for category in missing]
         )
-        embeddings[category] = response.data[0].embedding
     
     return embeddings
 
-def store_embeddings_in_pinecone(texts):
-    for text in texts:
-        categories = extract_categories_from_text(text['resume'])
-        category_embeddings = generate_category_embeddings(categories)
+def query_categories(query_embeddings, top_k=10):
+    # One filtered query per category, all in flight at the same time.
+    futures = {
+        category: query_executor.submit(
+            index.query,
+            vector=query_embeddings[category],
+            top_k=top_k,
+            filter={"category": category}
+        )
+        for category in CATEGORIES
+    }
+    return {category: future.result() for category, future in futures.items()}
+
+def resume_id_of(match):
+    # Vector ids are "<resume id>_<category>".
+    return match['id'].rsplit('_', 1)[0]
+
+def store_embeddings_in_pinecone(texts, upsert_batch_size=DEFAULT_UPSERT_BATCH_SIZE, extraction_concurrency=DEFAULT_EXTRACTION_CONCURRENCY, rpm=DEFAULT_EXTRACTION_RPM, tpm=DEFAULT_EXTRACTION_TPM):
+    vector_ids = {}
+    rate_limiter = RateLimiter(rpm, tpm)
+    with UpsertWriter(index, batch_size=upsert_batch_size) as writer:
+        for text, categories in extract_categories_concurrently(texts, extraction_concurrency, rate_limiter):
+            if categories is None:
+                continue
+            category_embeddings = generate_category_embeddings(categories)
+            vector_ids[text['id']] = []
 
-        for category, embedding in category_embeddings.items():
-            index.upsert([
-                {
-                    "id": f"text_{text['id']}_{category}",
+            for category, embedding in category_embeddings.items():
+                vector_ids[text['id']].append(f"{text['id']}_{category}")
+                writer.add({
+                    "id": f"{text['id']}_{category}",
                     "values": embedding,
                     "metadata": {
                         "id": text['id'],
-                        "resume": text['resume'],
-                        "content": ", ".join(categories[category]),
                         "category": category
                     }
-                }
-            ])
+                })
     
-    print("Embeddings generated and stored in Pinecone.")
+    print(f"Embeddings generated and stored in Pinecone ({writer.upserted} vectors).")
+    print("Embedding cache", embedding_cache.stats())
+    return vector_ids
+
+def resume_fingerprint(text):
+    return fingerprint(EXTRACTION_MODEL, EMBEDDING_MODEL, text['resume'])
+
+def ingest(chunks, manifest_path=DEFAULT_MANIFEST_PATH, full=False, **store_options):
+    manifest = {} if full else load_manifest(manifest_path)
+    if full:
+        index.delete(delete_all=True)
+        document_store.clear()
 
-def generate_response(query, top_candidates):
-    candidate_data = [
+    diff = ManifestDiff(manifest, resume_fingerprint)
+
+    def pending_records():
+        for chunk in chunks:
+            chunk = list(chunk)
+            pending = list(diff.pending(chunk))
+            pending_ids = {record["id"] for record in pending}
+            # Unchanged resumes are stored again if the document store lost them,
+            # e.g. when documents.sqlite3 was deleted but the manifest was kept.
+            unchanged = [record for record in chunk if record["id"] not in pending_ids]
+            stored = document_store.get_many(record["id"] for record in unchanged)
+            missing = [record for record in unchanged if record["id"] not in stored]
+            if missing:
+                print(f"Restoring {len(missing)} resumes missing from the document store")
+            document_store.put_many([(record["id"], record["resume"]) for record in pending + missing])
+            yield from pending
+
+    # Resumes that could not be stored are left out of the manifest and retried next run.
+    vector_ids = store_embeddings_in_pinecone(pending_records(), **store_options)
+    for record_id, record_vector_ids in vector_ids.items():
+        manifest[record_id] = {
+            "fingerprint": diff.fingerprints[record_id],
+            "vector_ids": record_vector_ids
+        }
+
+    deleted = diff.deleted()
+    stale_ids = [vector_id for record_id in deleted for vector_id in manifest[record_id]["vector_ids"]]
+    for start in range(0, len(stale_ids), 1000):
+        index.delete(ids=stale_ids[start:start + 1000])
+    document_store.delete_many(deleted)
+    for record_id in deleted:
+        del manifest[record_id]
+
+    print(f"Ingest: {diff.counts['new']} new, {diff.counts['changed']} changed, {len(deleted)} deleted, "
+          f"{diff.counts['unchanged']} unchanged")
+    index.flush()
+    save_manifest(manifest, manifest_path)
+
+def truncate_to_tokens(text, max_tokens):
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + "..."
+
+def budget_candidates(candidates, budget_tokens):
+    # Splits the prompt budget across candidates: short resumes are kept whole
+    # and the tokens they leave unused go to the longer ones, which are cut.
+    budgets = {}
+    remaining = budget_tokens
+    ordered = sorted(candidates, key=lambda candidate: estimate_tokens(candidate["resume"]))
+    for i, candidate in enumerate(ordered):
+        share = remaining // (len(ordered) - i)
+        budgets[candidate["id"]] = min(estimate_tokens(candidate["resume"]), share)
+        remaining -= budgets[candidate["id"]]
+    return [
         {
             "id": candidate["id"],
-            "resume": candidate["resume"]
+            "resume": truncate_to_tokens(candidate["resume"], budgets[candidate["id"]])
         }
-        for candidate in top_candidates
+        for candidate in candidates
     ]
 
-    candidates_json = json.dumps(candidate_data)
+def generate_response(query, top_candidates, prompt_token_budget=DEFAULT_PROMPT_TOKEN_BUDGET, stream=False):
+    candidate_data = budget_candidates(top_candidates, prompt_token_budget)
+
+    candidates_json = json.dumps(candidate_data, ensure_ascii=False)
 
     prompt = f"""You are a skilled talent recruiter. You have access to the resumes of the top candidates. Provide a brief summary of each candidate's resume to help your client make an informed decision. Don't skip any candidates—talk about all the candidates you are given.
 
@@ -155,59 +358,92 @@ def generate_response(query, top_candidates):
             {"role": "system", "content": prompt},
             {"role": "user", "content": f"Who are the top candidates for ${query}?"}
         ],
-        max_tokens=1000
+        max_tokens=1000,
+        stream=stream
     )
-    return response.choices[0].message.content
+    if not stream:
+        return response.choices[0].message.content
+
+    # Print tokens as they arrive and return the full text at the end.
+    parts = []
+    for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+            print(chunk.choices[0].delta.content, end="", flush=True)
+    print()
+    return "".join(parts)
+
+def run_query(user_query, fusion="sum", category_weights=None, prompt_token_budget=DEFAULT_PROMPT_TOKEN_BUDGET, stream=True):
+    extracted_categories = extract_categories_from_text(user_query)
+    query_embeddings = generate_category_embeddings(extracted_categories)
+    category_results = query_categories(query_embeddings)
+
+    category_arrays = {
+        category: match_arrays(category_results[category]['matches'], resume_id_of)
+        for category in CATEGORIES
+    }
+    top_ids, top_scores = fuse(category_arrays, fusion, category_weights)
+
+    # Resume bodies are only looked up for the final candidates. Candidates
+    # whose resume is missing from the document store are left out.
+    resumes = document_store.get_many(top_ids.tolist())
+    missing = [candidate_id for candidate_id in top_ids.tolist() if candidate_id not in resumes]
+    if missing:
+        print(f"Skipping {len(missing)} candidates missing from the document store; run the ingest again.")
+    top_candidates = [
+        {"id": candidate_id, "score": float(score), "resume": resumes[candidate_id]}
+        for candidate_id, score in zip(top_ids.tolist(), top_scores)
+        if candidate_id in resumes
+    ]
+
+    print(f"Found {len(top_candidates)} top candidates.")
+    print("Ordered by score:")
+    print("\n".join([f"ID: {candidate['id']}, Score: {candidate['score']}" for candidate in top_candidates]))
+
+    detailed_response = ""
+    if top_candidates:
+        if stream:
+            print("Response: ", end="", flush=True)
+            detailed_response = generate_response(user_query, top_candidates, prompt_token_budget, stream=True)
+        else:
+            detailed_response = generate_response(user_query, top_candidates, prompt_token_budget)
+            print(f"Response: {detailed_response}")
+    else:
+        detailed_response = "No relevant results found above the threshold."
+        print(detailed_response)
+    return detailed_response
 
 if __name__ == "__main__":
-    csv_path = "Resume.csv"
-    data = parseCSVFile(csv_path)
-    store_embeddings_in_pinecone(data)
     parser = argparse.ArgumentParser(description="Chat with OpenAI GPT model via command line.")
     parser.add_argument('query', type=str, help="The initial query text.")
+    parser.add_argument('--upsert-batch-size', type=int, default=DEFAULT_UPSERT_BATCH_SIZE, help="Maximum vectors per Pinecone upsert request.")
+    parser.add_argument('--extraction-concurrency', type=int, default=DEFAULT_EXTRACTION_CONCURRENCY, help="Number of category extractions running at once.")
+    parser.add_argument('--rpm', type=int, default=DEFAULT_EXTRACTION_RPM, help="Requests per minute budget for category extraction.")
+    parser.add_argument('--tpm', type=int, default=DEFAULT_EXTRACTION_TPM, help="Tokens per minute budget for category extraction.")
+    parser.add_argument('--fusion', choices=FUSION_METHODS, default="sum", help="How per-category scores are combined.")
+    parser.add_argument('--category-weights', default="", help="Per-category weights for weighted and rrf fusion, e.g. roles=2,skills=1.5")
+    parser.add_argument('--sample-size', type=int, default=DEFAULT_SAMPLE_SIZE, help="Number of resumes sampled from the CSV; 0 ingests every resume.")
+    parser.add_argument('--full-reingest', action='store_true', help="Clear the index and the ingest manifest, then ingest every resume.")
+    parser.add_argument('--prompt-token-budget', type=int, default=DEFAULT_PROMPT_TOKEN_BUDGET, help="Approximate token budget for the resumes sent to GPT.")
+    parser.add_argument('--no-stream', action='store_true', help="Print the answer only once it is complete.")
     args = parser.parse_args()
+
+    connect()
+    csv_path = "Resume.csv"
+    data = parseCSVFile(csv_path, args.sample_size)
+    ingest(
+        data,
+        full=args.full_reingest,
+        upsert_batch_size=args.upsert_batch_size,
+        extraction_concurrency=args.extraction_concurrency,
+        rpm=args.rpm,
+        tpm=args.tpm
+    )
+    category_weights = parse_weights(args.category_weights)
     user_query = args.query
 
     while True:
-        extracted_categories = extract_categories_from_text(user_query)
-        query_embeddings = generate_category_embeddings(extracted_categories)
-        categories = ['roles', 'skills', 'seniority', 'industry']
-
-        candidate_scores = {}
-
-        for category in categories:
-            query_embedding = query_embeddings[category]
-            
-            results = index.query(
-                vector=query_embedding,
-                top_k=10,
-                include_metadata=True,
-                filter={"category": category}
-            )
-
-            for match in results['matches']:
-                if match['metadata']['id'] not in candidate_scores:
-                    candidate_scores[match['metadata']['id']] = {
-                        "id": match['metadata']['id'],
-                        "score": 0,
-                        "resume": match['metadata']['resume']
-                    }
-
-                candidate_scores[match['metadata']['id']]["score"] += match['score']
-
-        top_candidates = sorted(candidate_scores.values(), key=lambda x: x["score"], reverse=True)[:10]
-
-        print(f"Found {len(top_candidates)} top candidates.")
-        print("Ordered by score:")
-        print("\n".join([f"ID: {candidate['id']}, Score: {candidate['score']}" for candidate in top_candidates]))
- 
-        detailed_response = ""
-        if top_candidates:
-            detailed_response = generate_response(user_query, top_candidates)
-            print(f"Response: {detailed_response}")
-        else:
-            detailed_response = "No relevant results found above the threshold."
-            print(detailed_response)
+        run_query(user_query, args.fusion, category_weights, args.prompt_token_budget, stream=not args.no_stream)
 
         user_query = input("Enter your next query (or type 'exit' to quit): ")
         if user_query.lower() == 'exit':
@@ -0,0 +1,112 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+
+DEFAULT_CACHE_PATH = "embedding_cache.sqlite3"
+DEFAULT_MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+
+def text_digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# Persistent embedding cache keyed by (model, sha256(text)). Vectors are stored
+# as float32 blobs; once the cache grows past max_bytes the least recently used
+# entries are evicted.
+class EmbeddingCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_CACHE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, digest TEXT NOT NULL, vector BLOB NOT NULL, "
+            "last_used REAL NOT NULL, PRIMARY KEY (model, digest))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def get(self, model, text):
+        return self.get_many(model, [text])[0]
+
+    def get_many(self, model, texts):
+        digests = [text_digest(text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(digests), 500):
+                chunk = digests[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT digest, vector FROM embeddings WHERE model = ? AND digest IN ({placeholders})",
+                    [model, *chunk],
+                )
+                for digest, blob in rows:
+                    found[digest] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND digest = ?",
+                    [(now, model, digest) for digest in found],
+                )
+                self._conn.commit()
+            results = [found.get(digest) for digest in digests]
+            hits = sum(result is not None for result in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def put(self, model, text, embedding):
+        self.put_many(model, [text], [embedding])
+
+    def put_many(self, model, texts, embeddings):
+        now = time.time()
+        rows = list({
+            text_digest(text): (model, text_digest(text), array("f", embedding).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        }.values())
+        with self._lock:
+            for model_name, digest, blob, _ in rows:
+                existing = self._conn.execute(
+                    "SELECT LENGTH(vector) FROM embeddings WHERE model = ? AND digest = ?",
+                    (model_name, digest),
+                ).fetchone()
+                self._size += len(blob) - (existing[0] if existing else 0)
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._evict()
+            self._conn.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size_bytes": self._size,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self):
+        while self._size > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT model, digest, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for model, digest, size in rows:
+                self._conn.execute("DELETE FROM embeddings WHERE model = ? AND digest = ?", (model, digest))
+                self._size -= size
+                self.evictions += 1
+                if self._size <= self.max_bytes:
+                    break
@@ -0,0 +1,52 @@
+import numpy as np
+
+FUSION_METHODS = ("sum", "weighted", "rrf")
+# Standard reciprocal-rank-fusion constant; dampens the advantage of the very top ranks.
+RRF_K = 60
+
+
+def match_arrays(matches, id_of):
+    ids = np.array([id_of(match) for match in matches], dtype=str)
+    scores = np.array([match["score"] for match in matches], dtype=np.float64)
+    return ids, scores
+
+
+def parse_weights(text):
+    # "roles=2,skills=1.5" -> {"roles": 2.0, "skills": 1.5}
+    weights = {}
+    for item in filter(None, (part.strip() for part in (text or "").split(","))):
+        category, _, value = item.partition("=")
+        weights[category.strip()] = float(value)
+    return weights
+
+
+# Fuses ranked (ids, scores) arrays, one pair per category, into a single
+# ranking and returns the top_k ids with their fused scores:
+# - sum: add up the similarity scores of every category a candidate matched in
+# - weighted: like sum, with each category's scores multiplied by its weight
+# - rrf: reciprocal rank fusion, sum of weight / (rrf_k + rank) over categories
+def fuse(category_arrays, method="sum", weights=None, top_k=10, rrf_k=RRF_K):
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method: {method}")
+    weights = weights or {}
+
+    ids = []
+    contributions = []
+    for category, (category_ids, scores) in category_arrays.items():
+        weight = 1.0 if method == "sum" else weights.get(category, 1.0)
+        if method == "rrf":
+            contribution = weight / (rrf_k + np.arange(1, len(category_ids) + 1))
+        else:
+            contribution = weight * scores
+        ids.append(category_ids)
+        contributions.append(contribution)
+
+    if not ids or sum(len(category_ids) for category_ids in ids) == 0:
+        return np.empty(0, dtype=str), np.empty(0, dtype=np.float64)
+
+    unique_ids, positions = np.unique(np.concatenate(ids), return_inverse=True)
+    fused = np.bincount(positions, weights=np.concatenate(contributions), minlength=len(unique_ids))
+    k = min(top_k, len(fused))
+    top = np.argpartition(-fused, k - 1)[:k]
+    top = top[np.argsort(-fused[top], kind="stable")]
+    return unique_ids[top], fused[top]
@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+
+DEFAULT_MANIFEST_PATH = "ingest_manifest.json"
+
+
+def resume_id(text):
+    # Derived from the resume text, so the id survives reordering of the CSV.
+    return "resume-" + hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def fingerprint(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def load_manifest(path=DEFAULT_MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as manifest_file:
+        return json.load(manifest_file)
+
+
+def save_manifest(manifest, path=DEFAULT_MANIFEST_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(tmp_path, path)
+
+
+# Streams records against what the manifest says is already in the index.
+# Records are dicts with an "id"; fingerprint_fn returns the fingerprint of
+# everything that went into a record's vectors. Only ids and fingerprints are
+# kept, so memory does not grow with the size of the records.
+class ManifestDiff:
+    def __init__(self, manifest, fingerprint_fn):
+        self.manifest = manifest
+        self.fingerprint_fn = fingerprint_fn
+        self.seen = set()
+        self.fingerprints = {}
+        self.counts = {"new": 0, "changed": 0, "unchanged": 0}
+
+    def pending(self, records):
+        # Yields the records that are new or changed.
+        for record in records:
+            self.seen.add(record["id"])
+            record_fingerprint = self.fingerprint_fn(record)
+            entry = self.manifest.get(record["id"])
+            if entry is None:
+                kind = "new"
+            elif entry["fingerprint"] != record_fingerprint:
+                kind = "changed"
+            else:
+                self.counts["unchanged"] += 1
+                continue
+            self.counts[kind] += 1
+            self.fingerprints[record["id"]] = record_fingerprint
+            yield record
+
+    def deleted(self):
+        # Only complete once every record has gone through pending().
+        return [record_id for record_id in self.manifest if record_id not in self.seen]
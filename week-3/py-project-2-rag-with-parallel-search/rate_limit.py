@@ -0,0 +1,61 @@
+import random
+import threading
+import time
+
+
+# Classic token bucket: holds up to `per_minute` tokens and refills
+# continuously at per_minute / 60 tokens per second.
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Keeps callers inside both a requests-per-minute and a tokens-per-minute budget.
+class RateLimiter:
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    def acquire(self, tokens):
+        self.requests.acquire(1)
+        self.tokens.acquire(tokens)
+
+
+def retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return 0
+    try:
+        return float(response.headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def call_with_backoff(fn, *args, retry_on=(Exception,), max_retries=5, base_delay=1.0, max_delay=60.0, **kwargs):
+    for attempt in range(max_retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except retry_on as e:
+            if attempt == max_retries:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            delay = max(delay, retry_after_seconds(e))
+            print(f"Request failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)